@@ -1,7 +1,85 @@
+import asyncio
 import logging
 import sqlite3
+import time
+from collections import OrderedDict, defaultdict
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import (Any, AsyncIterator, Dict, Iterable, List, Mapping,
+                    Optional, Tuple)
+
+import aiosqlite
+
+DEFAULT_DB_PATH = "data/message_history.db"
+
+# Number of (conversation_id, limit) results kept by Database's message cache
+MESSAGE_CACHE_SIZE = 256
+
+# Applied to every pooled connection. WAL lets readers proceed during writes and,
+# with synchronous=NORMAL, avoids an fsync on every commit.
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-64000",
+)
+
+# All tables and indexes, created in a single transaction on connect. The
+# indexes cover the per-user conversation lookups and per-conversation message
+# reads so they don't scan the whole table.
+SCHEMA_SQL = """
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS conversations (
+    conversation_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    guild_id INTEGER,
+    channel_id INTEGER NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    is_active BOOLEAN DEFAULT 1
+);
+
+CREATE TABLE IF NOT EXISTS messages (
+    message_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    conversation_id INTEGER NOT NULL,
+    discord_message_id INTEGER,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    timestamp INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER) * 1000000000),
+    has_images BOOLEAN DEFAULT 0,
+    FOREIGN KEY (conversation_id) REFERENCES conversations(conversation_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_conv_user_active
+ON conversations(user_id, is_active);
+
+CREATE INDEX IF NOT EXISTS idx_messages_conv
+ON messages(conversation_id, timestamp);
+
+COMMIT;
+"""
+
+# Bumped whenever a migration is added below; stored in PRAGMA user_version
+SCHEMA_VERSION = 1
+
+# Version 1: message timestamps are INTEGER nanoseconds since the epoch instead
+# of ISO strings. Existing rows are converted at millisecond precision, which is
+# all julianday() keeps; message_id breaks any ties when ordering. The old rows
+# were naive local times from datetime.now(), so 'utc' shifts them by the host's
+# offset to line up with the time.time_ns() values written since.
+MIGRATE_SQL = f"""
+BEGIN;
+
+UPDATE messages
+SET timestamp = CAST(ROUND((julianday(timestamp, 'utc') - 2440587.5) * 86400000) AS INTEGER)
+    * 1000000
+WHERE typeof(timestamp) = 'text';
+
+PRAGMA user_version = {SCHEMA_VERSION};
+
+COMMIT;
+"""
 
 
 # Add this function at the top of the file
@@ -18,106 +96,159 @@ def convert_datetime(val):
         return datetime.fromisoformat(val.decode().replace("Z", "+00:00"))
 
 
+class ConnectionPool:
+    """
+    A pool of reusable aiosqlite connections.
+    Connections are opened on demand up to max_size and handed back to an idle
+    queue after use, so handlers don't pay for a fresh connection per query.
+    """
+
+    def __init__(
+        self, db_path: str = DEFAULT_DB_PATH, min_size: int = 1, max_size: int = 8
+    ):
+        self.db_path = db_path
+        self.min_size = min_size
+        self.max_size = max_size
+        self._idle: asyncio.Queue[aiosqlite.Connection] = asyncio.Queue()
+        self._size = 0
+
+    async def open(self):
+        """Open the minimum number of connections."""
+        while self._size < self.min_size:
+            self._idle.put_nowait(await self._connect())
+
+    async def _connect(self) -> aiosqlite.Connection:
+        # Reserve the slot before awaiting so concurrent acquires can't overshoot
+        self._size += 1
+        try:
+            conn = await aiosqlite.connect(self.db_path)
+        except Exception:
+            self._size -= 1
+            raise
+
+        # Rows support both index and name access without building a dict per row
+        conn.row_factory = sqlite3.Row
+        try:
+            for pragma in CONNECTION_PRAGMAS:
+                await conn.execute(pragma)
+        except Exception:
+            self._size -= 1
+            await conn.close()
+            raise
+        return conn
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Borrow a connection from the pool, returning it when done."""
+        if self._idle.empty() and self._size < self.max_size:
+            conn = await self._connect()
+        else:
+            conn = await self._idle.get()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                await conn.rollback()
+            self._idle.put_nowait(conn)
+
+    async def close(self):
+        """Close all connections, waiting for borrowed ones to be returned."""
+        while self._size > 0:
+            conn = await self._idle.get()
+            self._size -= 1
+            await conn.close()
+
+
+async def create_pool(
+    db_path: str = DEFAULT_DB_PATH, min_size: int = 1, max_size: int = 8
+) -> ConnectionPool:
+    """Create and open a connection pool for the given database."""
+    pool = ConnectionPool(db_path, min_size=min_size, max_size=max_size)
+    await pool.open()
+    return pool
+
+
 class Database:
     """
     Handles storage and retrieval of message history for the bot.
-    Uses SQLite for persistence.
+    Uses SQLite for persistence, with connections borrowed from a shared pool.
     """
 
-    def __init__(self, db_path: str = "data/message_history.db"):
-        self.db_path = db_path
+    def __init__(self, pool: ConnectionPool):
+        self.pool = pool
+        self.db_path = pool.db_path
+
+        # Conversation history is read far more often than it's written, so
+        # results are cached and invalidated by bumping a per-conversation
+        # version whenever messages are added
+        self._versions: Dict[int, int] = defaultdict(int)
+        self._message_cache: OrderedDict[
+            Tuple[int, int], Tuple[int, List[sqlite3.Row]]
+        ] = OrderedDict()
 
         # Register adapters for datetime objects
         sqlite3.register_adapter(datetime, adapt_datetime)
         sqlite3.register_converter("timestamp", convert_datetime)
 
-        self._create_tables()
+    async def connect(self):
+        """Open the connection pool and create the tables if they don't exist."""
+        await self.pool.open()
+        await self._create_tables()
 
-    def _create_tables(self):
-        """Create necessary tables if they don't exist."""
-        conn = sqlite3.connect(self.db_path)
-        try:
-            cursor = conn.cursor()
-
-            # Create conversations table
-            cursor.execute(
-                """
-            CREATE TABLE IF NOT EXISTS conversations (
-                conversation_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                guild_id INTEGER,
-                channel_id INTEGER NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                is_active BOOLEAN DEFAULT 1
-            )
-            """
-            )
-
-            # Create messages table
-            cursor.execute(
-                """
-            CREATE TABLE IF NOT EXISTS messages (
-                message_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                conversation_id INTEGER NOT NULL,
-                discord_message_id INTEGER,
-                role TEXT NOT NULL,
-                content TEXT NOT NULL,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                has_images BOOLEAN DEFAULT 0,
-                FOREIGN KEY (conversation_id) REFERENCES conversations(conversation_id)
-            )
-            """
-            )
-
-            conn.commit()
-        except Exception as e:
-            logging.error(f"Error creating database tables: {e}")
-            conn.rollback()
-        finally:
-            conn.close()
+    async def close(self):
+        """Close all pooled connections."""
+        await self.pool.close()
 
-    def create_conversation(
+    async def _create_tables(self):
+        """Create necessary tables if they don't exist."""
+        async with self.pool.acquire() as conn:
+            try:
+                await conn.executescript(SCHEMA_SQL)
+
+                cursor = await conn.execute("PRAGMA user_version")
+                if (await cursor.fetchone())[0] < SCHEMA_VERSION:
+                    await conn.executescript(MIGRATE_SQL)
+            except Exception as e:
+                logging.error("Error creating database tables: %s", e)
+                await conn.rollback()
+
+    async def create_conversation(
         self, user_id: int, guild_id: Optional[int], channel_id: int
     ) -> int:
         """
         Create a new conversation for a user.
         Returns the conversation ID.
         """
-        conn = sqlite3.connect(self.db_path)
-        try:
-            cursor = conn.cursor()
-
-            # First, mark any active conversations for this user as inactive
-            cursor.execute(
-                """
-            UPDATE conversations 
-            SET is_active = 0, updated_at = ?
-            WHERE user_id = ? AND is_active = 1
-            """,
-                (datetime.now(), user_id),
-            )
-
-            # Create a new conversation
-            cursor.execute(
-                """
-            INSERT INTO conversations (user_id, guild_id, channel_id, created_at, updated_at)
-            VALUES (?, ?, ?, ?, ?)
-            """,
-                (user_id, guild_id, channel_id, datetime.now(), datetime.now()),
-            )
-
-            conversation_id = cursor.lastrowid
-            conn.commit()
-            return conversation_id
-        except Exception as e:
-            logging.error(f"Error creating conversation: {e}")
-            conn.rollback()
-            return -1
-        finally:
-            conn.close()
-
-    def add_message(
+        async with self.pool.acquire() as conn:
+            try:
+                # First, mark any active conversations for this user as inactive
+                await conn.execute(
+                    """
+                UPDATE conversations 
+                SET is_active = 0, updated_at = ?
+                WHERE user_id = ? AND is_active = 1
+                """,
+                    (datetime.now(), user_id),
+                )
+
+                # Create a new conversation
+                cursor = await conn.execute(
+                    """
+                INSERT INTO conversations (user_id, guild_id, channel_id, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                    (user_id, guild_id, channel_id, datetime.now(), datetime.now()),
+                )
+
+                conversation_id = cursor.lastrowid
+                await conn.commit()
+                return conversation_id
+            except Exception as e:
+                logging.error("Error creating conversation: %s", e)
+                await conn.rollback()
+                return -1
+
+    async def add_message(
         self,
         conversation_id: int,
         role: str,
@@ -129,185 +260,267 @@ class Database:
         Add a message to a conversation.
         Returns True if successful, False otherwise.
         """
-        conn = sqlite3.connect(self.db_path)
-        try:
-            cursor = conn.cursor()
+        return await self.add_messages(
+            conversation_id, [(role, content, discord_message_id, has_images)]
+        )
 
-            # Get the current timestamp
-            current_time = datetime.now()
-
-            # Add the message
-            cursor.execute(
-                """
-            INSERT INTO messages (conversation_id, discord_message_id, role, content, timestamp, has_images)
-            VALUES (?, ?, ?, ?, ?, ?)
-            """,
-                (
-                    conversation_id,
-                    discord_message_id,
-                    role,
-                    content,
-                    current_time,
-                    has_images,
-                ),
-            )
-
-            # Update the conversation's updated_at timestamp
-            cursor.execute(
+    async def add_messages(
+        self,
+        conversation_id: int,
+        messages: Iterable[Tuple[str, str, Optional[int], bool]],
+    ) -> bool:
+        """
+        Add several messages to a conversation in a single transaction.
+        Each message is a (role, content, discord_message_id, has_images) tuple.
+        Returns True if successful, False otherwise.
+        """
+        async with self.pool.acquire() as conn:
+            try:
+                # Get the current timestamp
+                current_time = datetime.now()
+                timestamp_ns = time.time_ns()
+
+                # Add the messages
+                await conn.executemany(
+                    """
+                INSERT INTO messages (conversation_id, discord_message_id, role, content, timestamp, has_images)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                    [
+                        (
+                            conversation_id,
+                            discord_message_id,
+                            role,
+                            content,
+                            timestamp_ns,
+                            has_images,
+                        )
+                        for role, content, discord_message_id, has_images in messages
+                    ],
+                )
+
+                # Update the conversation's updated_at timestamp
+                await conn.execute(
+                    """
+                UPDATE conversations 
+                SET updated_at = ?
+                WHERE conversation_id = ?
+                """,
+                    (current_time, conversation_id),
+                )
+
+                await conn.commit()
+                self._versions[conversation_id] += 1
+                return True
+            except Exception as e:
+                logging.error("Error adding messages: %s", e)
+                await conn.rollback()
+                return False
+
+    async def bulk_load(
+        self,
+        messages_by_conversation: Mapping[
+            int, Iterable[Tuple[str, str, Optional[int], bool]]
+        ],
+    ) -> bool:
+        """
+        Load a large batch of messages, e.g. when replaying history.
+        Takes the same message tuples as add_messages, keyed by conversation ID.
+        The message index is dropped and rebuilt once instead of being updated per
+        row, and fsyncs are skipped until the load is done.
+        Returns True if successful, False otherwise.
+        """
+        async with self.pool.acquire() as conn:
+            await conn.execute("PRAGMA synchronous=OFF")
+            try:
+                current_time = datetime.now()
+                timestamp_ns = time.time_ns()
+
+                await conn.execute("BEGIN")
+                await conn.execute("DROP INDEX IF EXISTS idx_messages_conv")
+                await conn.executemany(
+                    """
+                INSERT INTO messages (conversation_id, discord_message_id, role, content, timestamp, has_images)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                    [
+                        (
+                            conversation_id,
+                            discord_message_id,
+                            role,
+                            content,
+                            timestamp_ns,
+                            has_images,
+                        )
+                        for conversation_id, messages in messages_by_conversation.items()
+                        for role, content, discord_message_id, has_images in messages
+                    ],
+                )
+                await conn.executemany(
+                    """
+                UPDATE conversations 
+                SET updated_at = ?
+                WHERE conversation_id = ?
+                """,
+                    [
+                        (current_time, conversation_id)
+                        for conversation_id in messages_by_conversation
+                    ],
+                )
+                await conn.execute(
+                    """
+                CREATE INDEX idx_messages_conv
+                ON messages(conversation_id, timestamp)
                 """
-            UPDATE conversations 
-            SET updated_at = ?
-            WHERE conversation_id = ?
-            """,
-                (current_time, conversation_id),
-            )
-
-            conn.commit()
-            return True
-        except Exception as e:
-            logging.error(f"Error adding message: {e}")
-            conn.rollback()
-            return False
-        finally:
-            conn.close()
-
-    def get_active_conversation(self, user_id: int) -> Optional[int]:
+                )
+                await conn.commit()
+
+                for conversation_id in messages_by_conversation:
+                    self._versions[conversation_id] += 1
+                return True
+            except Exception as e:
+                logging.error("Error bulk loading messages: %s", e)
+                await conn.rollback()
+                return False
+            finally:
+                # Pooled connections are shared, so put the normal setting back
+                await conn.execute("PRAGMA synchronous=NORMAL")
+
+    async def get_active_conversation(self, user_id: int) -> Optional[int]:
         """
         Get the active conversation ID for a user.
         Returns None if no active conversation exists.
         """
-        conn = sqlite3.connect(self.db_path)
-        try:
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-            SELECT conversation_id FROM conversations
-            WHERE user_id = ? AND is_active = 1
-            ORDER BY updated_at DESC
-            LIMIT 1
-            """,
-                (user_id,),
-            )
-
-            result = cursor.fetchone()
-            return result[0] if result else None
-        except Exception as e:
-            logging.error(f"Error getting active conversation: {e}")
-            return None
-        finally:
-            conn.close()
-
-    def get_conversation_messages(
+        async with self.pool.acquire() as conn:
+            try:
+                cursor = await conn.execute(
+                    """
+                SELECT conversation_id FROM conversations
+                WHERE user_id = ? AND is_active = 1
+                ORDER BY updated_at DESC
+                LIMIT 1
+                """,
+                    (user_id,),
+                )
+
+                result = await cursor.fetchone()
+                return result[0] if result else None
+            except Exception as e:
+                logging.error("Error getting active conversation: %s", e)
+                return None
+
+    async def get_conversation_messages(
         self, conversation_id: int, limit: int = 25
-    ) -> List[Dict[str, Any]]:
+    ) -> List[sqlite3.Row]:
         """
         Get the messages for a conversation.
-        Returns a list of message dictionaries in chronological order (oldest first).
+        Returns a list of rows with role and content columns,
+        in chronological order (oldest first).
+        Results are cached until messages are added to the conversation.
         """
-        conn = sqlite3.connect(self.db_path)
-        try:
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-            SELECT role, content, has_images, timestamp
-            FROM messages
-            WHERE conversation_id = ?
-            ORDER BY timestamp ASC
-            LIMIT ?
-            """,
-                (conversation_id, limit),
-            )
-
-            messages = []
-            for row in cursor.fetchall():
-                role, content, has_images, timestamp = row
-                message = {"role": role, "content": content}
-                messages.append(message)
-
-            return messages
-        except Exception as e:
-            logging.error(f"Error getting conversation messages: {e}")
-            return []
-        finally:
-            conn.close()
-
-    def reset_user_history(self, user_id: int) -> bool:
+        key = (conversation_id, limit)
+        # .get() so that reads never add entries to the defaultdict
+        version = self._versions.get(conversation_id, 0)
+        cached = self._message_cache.get(key)
+        if cached is not None and cached[0] == version:
+            self._message_cache.move_to_end(key)
+            return list(cached[1])
+
+        async with self.pool.acquire() as conn:
+            try:
+                cursor = await conn.execute(
+                    """
+                SELECT role, content
+                FROM messages
+                WHERE conversation_id = ?
+                ORDER BY timestamp ASC, message_id ASC
+                LIMIT ?
+                """,
+                    (conversation_id, limit),
+                )
+                messages = await cursor.fetchall()
+            except Exception as e:
+                logging.error("Error getting conversation messages: %s", e)
+                return []
+
+        # Tagged with the version read before the query, so a write that
+        # landed in the meantime invalidates this entry
+        self._message_cache[key] = (version, messages)
+        self._message_cache.move_to_end(key)
+        if len(self._message_cache) > MESSAGE_CACHE_SIZE:
+            self._message_cache.popitem(last=False)
+        return list(messages)
+
+    async def reset_user_history(self, user_id: int) -> bool:
         """
         Reset a user's conversation history by marking all conversations as inactive.
         Returns True if successful, False otherwise.
         """
-        conn = sqlite3.connect(self.db_path)
-        try:
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-            UPDATE conversations 
-            SET is_active = 0, updated_at = ?
-            WHERE user_id = ?
-            """,
-                (datetime.now(), user_id),
-            )
-
-            conn.commit()
-            return True
-        except Exception as e:
-            logging.error(f"Error resetting user history: {e}")
-            conn.rollback()
-            return False
-        finally:
-            conn.close()
-
-    def get_user_stats(self, user_id: int) -> Dict[str, Any]:
+        async with self.pool.acquire() as conn:
+            try:
+                await conn.execute(
+                    """
+                UPDATE conversations 
+                SET is_active = 0, updated_at = ?
+                WHERE user_id = ?
+                """,
+                    (datetime.now(), user_id),
+                )
+
+                await conn.commit()
+                return True
+            except Exception as e:
+                logging.error("Error resetting user history: %s", e)
+                await conn.rollback()
+                return False
+
+    async def get_user_stats(self, user_id: int) -> Dict[str, Any]:
         """
         Get usage statistics for a user.
         Returns a dictionary with statistics.
         """
-        conn = sqlite3.connect(self.db_path)
-        try:
-            cursor = conn.cursor()
-
-            # Get total number of messages
-            cursor.execute(
-                """
-            SELECT COUNT(*) FROM messages m
-            JOIN conversations c ON m.conversation_id = c.conversation_id
-            WHERE c.user_id = ?
-            """,
-                (user_id,),
-            )
-            total_messages = cursor.fetchone()[0]
-
-            # Get total number of conversations
-            cursor.execute(
-                """
-            SELECT COUNT(*) FROM conversations
-            WHERE user_id = ?
-            """,
-                (user_id,),
-            )
-            total_conversations = cursor.fetchone()[0]
-
-            # Get first conversation date
-            cursor.execute(
-                """
-            SELECT MIN(created_at) FROM conversations
-            WHERE user_id = ?
-            """,
-                (user_id,),
-            )
-            first_conversation = cursor.fetchone()[0]
-
-            return {
-                "total_messages": total_messages,
-                "total_conversations": total_conversations,
-                "first_conversation": first_conversation,
-            }
-        except Exception as e:
-            logging.error(f"Error getting user stats: {e}")
-            return {
-                "total_messages": 0,
-                "total_conversations": 0,
-                "first_conversation": None,
-            }
-        finally:
-            conn.close()
+        async with self.pool.acquire() as conn:
+            try:
+                # Get total number of messages
+                cursor = await conn.execute(
+                    """
+                SELECT COUNT(*) FROM messages m
+                JOIN conversations c ON m.conversation_id = c.conversation_id
+                WHERE c.user_id = ?
+                """,
+                    (user_id,),
+                )
+                total_messages = (await cursor.fetchone())[0]
+
+                # Get total number of conversations
+                cursor = await conn.execute(
+                    """
+                SELECT COUNT(*) FROM conversations
+                WHERE user_id = ?
+                """,
+                    (user_id,),
+                )
+                total_conversations = (await cursor.fetchone())[0]
+
+                # Get first conversation date
+                cursor = await conn.execute(
+                    """
+                SELECT MIN(created_at) FROM conversations
+                WHERE user_id = ?
+                """,
+                    (user_id,),
+                )
+                first_conversation = (await cursor.fetchone())[0]
+
+                return {
+                    "total_messages": total_messages,
+                    "total_conversations": total_conversations,
+                    "first_conversation": first_conversation,
+                }
+            except Exception as e:
+                logging.error("Error getting user stats: %s", e)
+                return {
+                    "total_messages": 0,
+                    "total_conversations": 0,
+                    "first_conversation": None,
+                }
@@ -1,18 +1,21 @@
 import asyncio
 import logging
+from asyncio import create_task
+from contextlib import aclosing
 from datetime import datetime
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
 import discord
 import httpx
 from discord import app_commands
 
-from app.database import Database
+from app.database import ConnectionPool, Database
 from app.llm_client import LLMClient
 from app.message_store import MessageStore
 from app.models import ConversationWarnings, MsgNode
-from app.utils import (check_permissions, create_embed_for_warnings,
-                       extract_message_content, find_parent_message)
+from app.utils import (buffer_stream, check_permissions,
+                       create_embed_for_warnings, extract_message_content,
+                       find_parent_message)
 from config.config import Config
 
 
@@ -22,7 +25,7 @@ class LLMCordClient(discord.Client):
     Handles Discord events and message processing.
     """
 
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, db_pool: ConnectionPool):
         self.config = config
 
         # Setup Discord client with proper intents
@@ -33,11 +36,34 @@ class LLMCordClient(discord.Client):
         )
 
         # Initialize internal components
-        self.http_client = httpx.AsyncClient()
+        # Shared client for attachment downloads so connections to the CDN are reused
+        self.http_client = httpx.AsyncClient(
+            timeout=30,
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+        )
         self.llm_client = LLMClient(config)
         self.message_store = MessageStore(config)
-        self.db = Database()  # Initialize the database
+        self.db = Database(db_pool)
         self.last_task_time = 0
+        self._invite_url: Optional[str] = None
+
+        # Message fetches in flight, keyed by (channel ID, message ID), so chain
+        # walks running at the same time share one request per message
+        self._pending_fetches: Dict[Tuple[int, int], asyncio.Future] = {}
+        # Caps concurrent fetches to stay clear of Discord's rate limits
+        self._fetch_semaphore = asyncio.Semaphore(5)
+
+        # Slash commands by name, registered on the command tree in setup_hook
+        self._commands = {
+            "reset": (
+                "Reset your conversation history with the bot",
+                self._cmd_reset,
+            ),
+            "stats": (
+                "Show your conversation statistics with the bot",
+                self._cmd_stats,
+            ),
+        }
 
         # The tree attribute will be set in the setup_hook
         self.tree = None
@@ -46,88 +72,115 @@ class LLMCordClient(discord.Client):
         super().__init__(intents=intents, activity=activity)
 
     async def setup_hook(self):
-        """Set up the bot's slash commands."""
+        """Set up the database and the bot's slash commands."""
         # Initialize the command tree now that the client is fully initialized
         self.tree = app_commands.CommandTree(self)
 
         # Register slash commands
-        @self.tree.command(
-            name="reset", description="Reset your conversation history with the bot"
-        )
-        async def reset(interaction: discord.Interaction):
-            """Reset the user's conversation history."""
-            success = self.db.reset_user_history(interaction.user.id)
-            if bool(success):
-                await interaction.response.send_message(
-                    "Your conversation history has been reset. Starting fresh!"
-                )
-            else:
-                await interaction.response.send_message(
-                    "There was an error resetting your conversation history."
+        for name, (description, callback) in self._commands.items():
+            self.tree.add_command(
+                app_commands.Command(
+                    name=name, description=description, callback=callback
                 )
+            )
 
-        @self.tree.command(
-            name="stats", description="Show your conversation statistics with the bot"
+        # These are independent, so overlap them instead of paying for each in turn
+        await asyncio.gather(
+            self.db.connect(), self._sync_commands(), self._warm_up_provider()
         )
-        async def stats(interaction: discord.Interaction):
-            """Show user statistics."""
-            stats = self.db.get_user_stats(interaction.user.id)
-            if stats:
-                # Format the statistics in a more readable way
-                embed = discord.Embed(
-                    title="Your Conversation Statistics", color=0x3498DB
-                )
-                embed.add_field(
-                    name="Total Messages",
-                    value=f"{stats['total_messages']:,}",
-                    inline=True,
-                )
-                embed.add_field(
-                    name="Total Conversations",
-                    value=f"{stats['total_conversations']:,}",
-                    inline=True,
-                )
 
-                first_convo = stats["first_conversation"]
-                if first_convo:
-                    if isinstance(first_convo, str):
-                        try:
-                            first_convo = datetime.fromisoformat(first_convo)
-                        except ValueError:
-                            pass
-
-                    if isinstance(first_convo, datetime):
-                        formatted_date = first_convo.strftime("%B %d, %Y")
-                        embed.add_field(
-                            name="First Conversation", value=formatted_date, inline=True
-                        )
-                    else:
-                        embed.add_field(
-                            name="First Conversation",
-                            value=str(first_convo),
-                            inline=True,
-                        )
+    async def _cmd_reset(self, interaction: discord.Interaction):
+        """Reset the user's conversation history."""
+        success = await self.db.reset_user_history(interaction.user.id)
+        if bool(success):
+            await interaction.response.send_message(
+                "Your conversation history has been reset. Starting fresh!"
+            )
+        else:
+            await interaction.response.send_message(
+                "There was an error resetting your conversation history."
+            )
 
-                await interaction.response.send_message(embed=embed)
-            else:
-                await interaction.response.send_message(
-                    "No conversation statistics found for you."
-                )
+    async def _cmd_stats(self, interaction: discord.Interaction):
+        """Show user statistics."""
+        stats = await self.db.get_user_stats(interaction.user.id)
+        if stats:
+            # Format the statistics in a more readable way
+            embed = discord.Embed(title="Your Conversation Statistics", color=0x3498DB)
+            embed.add_field(
+                name="Total Messages",
+                value=f"{stats['total_messages']:,}",
+                inline=True,
+            )
+            embed.add_field(
+                name="Total Conversations",
+                value=f"{stats['total_conversations']:,}",
+                inline=True,
+            )
 
-        # Sync commands with Discord
+            first_convo = stats["first_conversation"]
+            if first_convo:
+                if isinstance(first_convo, str):
+                    try:
+                        first_convo = datetime.fromisoformat(first_convo)
+                    except ValueError:
+                        pass
+
+                if isinstance(first_convo, datetime):
+                    formatted_date = first_convo.strftime("%B %d, %Y")
+                    embed.add_field(
+                        name="First Conversation", value=formatted_date, inline=True
+                    )
+                else:
+                    embed.add_field(
+                        name="First Conversation",
+                        value=str(first_convo),
+                        inline=True,
+                    )
+
+            await interaction.response.send_message(embed=embed)
+        else:
+            await interaction.response.send_message(
+                "No conversation statistics found for you."
+            )
+
+    async def _sync_commands(self):
+        """Sync the registered slash commands with Discord."""
         await self.tree.sync()
         logging.info("Slash commands registered")
 
+    async def _warm_up_provider(self):
+        """Open a connection to the configured provider ahead of the first request."""
+        provider = self.config.model.split("/", 1)[0]
+        try:
+            await asyncio.wait_for(
+                self.llm_client.get_client(provider).models.list(), timeout=5
+            )
+        except Exception as e:
+            # A provider that's down shouldn't stop the bot from starting
+            logging.warning("Failed to warm up provider %s: %s", provider, e)
+
+    async def close(self):
+        """Close the Discord connection and release HTTP, LLM and database resources."""
+        # Stop receiving events first so no handler is left using a closed resource
+        await super().close()
+        await self.http_client.aclose()
+        await self.llm_client.aclose()
+        await self.db.close()
+
     async def on_ready(self):
         """Handle bot ready event."""
-        logging.info(f"Logged in as {self.user} (ID: {self.user.id})")
+        logging.info("Logged in as %s (ID: %s)", self.user, self.user.id)
 
         if self.config.client_id:
-            logging.info(
-                f"\n\nBOT INVITE URL:\n"
-                f"https://discord.com/api/oauth2/authorize?client_id={self.config.client_id}"
-                f"&permissions=412317273088&scope=bot%20applications.commands\n"
-            )
+            # on_ready fires again on every reconnect, so only build the URL once
+            if self._invite_url is None:
+                self._invite_url = (
+                    "https://discord.com/api/oauth2/authorize"
+                    f"?client_id={self.config.client_id}"
+                    "&permissions=412317273088&scope=bot%20applications.commands"
+                )
+            logging.info("\n\nBOT INVITE URL:\n%s\n", self._invite_url)
 
     async def on_message(self, message: discord.Message):
         """Handle incoming messages."""
@@ -135,11 +188,9 @@ class LLMCordClient(discord.Client):
         if message.author.bot:
             return
 
-        # Check if the bot was mentioned or if it's a DM
+        # Only respond to DMs or mentions; the mention scan is skipped for DMs
         is_dm = message.channel.type == discord.ChannelType.private
-        is_mentioned = self.user in message.mentions
-
-        if not (is_dm or is_mentioned):
+        if not is_dm and self.user not in message.mentions:
             return
 
         # Update config in case it was changed
@@ -155,10 +206,19 @@ class LLMCordClient(discord.Client):
     async def process_message_node(self, msg: discord.Message, node: MsgNode):
         """Process a message and update its node with content and metadata."""
         if node.text is None:
-            # Extract content and update node
-            text, images, has_bad_attachments = await extract_message_content(
-                msg, node, self.http_client, self.config
-            )
+            # Attachment downloads and the parent lookup are independent
+            # requests, so run them concurrently
+            parent_lookup = asyncio.ensure_future(self.find_parent_node(msg, node))
+            try:
+                text, images, has_bad_attachments = await extract_message_content(
+                    msg, node, self.http_client, self.config
+                )
+            except BaseException:
+                # Don't leave the lookup running with nobody to await it
+                parent_lookup.cancel()
+                await asyncio.gather(parent_lookup, return_exceptions=True)
+                raise
+            await parent_lookup
 
             node.text = text
             node.images = images
@@ -166,15 +226,42 @@ class LLMCordClient(discord.Client):
             node.role = "assistant" if msg.author == self.user else "user"
             node.user_id = msg.author.id if node.role == "user" else None
 
-            # Try to find parent message if not already set
-            if node.parent_msg is None:
-                try:
-                    node.parent_msg = await find_parent_message(msg)
-                    if node.parent_msg is None and msg.reference:
-                        node.fetch_parent_failed = True
-                except Exception as e:
-                    logging.warning(f"Error finding parent message: {str(e)}")
-                    node.fetch_parent_failed = True
+    async def find_parent_node(self, msg: discord.Message, node: MsgNode):
+        """Find the parent message of a node if not already set."""
+        if node.parent_msg is not None:
+            return
+
+        try:
+            node.parent_msg = await find_parent_message(
+                msg, fetch_message=self.fetch_message_cached
+            )
+            if node.parent_msg is None and msg.reference:
+                node.fetch_parent_failed = True
+        except Exception as e:
+            logging.warning("Error finding parent message: %s", e)
+            node.fetch_parent_failed = True
+
+    async def fetch_message_cached(
+        self, channel: discord.abc.Messageable, message_id: int
+    ) -> discord.Message:
+        """
+        Fetch a message, sharing one request between concurrent callers.
+        At most five fetches run at once.
+        """
+        key = (channel.id, message_id)
+        future = self._pending_fetches.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._fetch_message(channel, message_id))
+            self._pending_fetches[key] = future
+            future.add_done_callback(lambda _: self._pending_fetches.pop(key, None))
+        # One caller giving up shouldn't cancel the fetch for the others
+        return await asyncio.shield(future)
+
+    async def _fetch_message(
+        self, channel: discord.abc.Messageable, message_id: int
+    ) -> discord.Message:
+        async with self._fetch_semaphore:
+            return await channel.fetch_message(message_id)
 
     async def build_message_chain(
         self, start_msg: discord.Message
@@ -218,31 +305,10 @@ class LLMCordClient(discord.Client):
                 await self.process_message_node(curr_msg, curr_node)
 
                 # Prepare content for the LLM
-                content = None
-                if curr_node.images[:max_images]:
-                    # For vision models with images
-                    text_content = (
-                        curr_node.text[: self.config.max_text] if curr_node.text else ""
-                    )
-                    content = []
-                    if text_content:
-                        content.append({"type": "text", "text": text_content})
-                    content.extend(curr_node.images[:max_images])
-                else:
-                    # Text only
-                    content = (
-                        curr_node.text[: self.config.max_text] if curr_node.text else ""
-                    )
-
-                if content and (
-                    isinstance(content, str)
-                    and content != ""
-                    or isinstance(content, list)
-                    and len(content) > 0
-                ):
-                    message = {"content": content, "role": curr_node.role}
-                    if accept_usernames and curr_node.user_id is not None:
-                        message["name"] = str(curr_node.user_id)
+                message = curr_node.to_api_message(
+                    self.config.max_text, max_images, include_name=accept_usernames
+                )
+                if message is not None:
                     immediate_messages.append(message)
 
                 # Check for warnings
@@ -279,51 +345,24 @@ class LLMCordClient(discord.Client):
             guild_id = start_msg.guild.id if start_msg.guild else None
 
             # Get active conversation or create a new one if none exists
-            conversation_id = self.db.get_active_conversation(user_id)
+            conversation_id = await self.db.get_active_conversation(user_id)
             if not conversation_id:
-                conversation_id = self.db.create_conversation(
+                conversation_id = await self.db.create_conversation(
                     user_id, guild_id, start_msg.channel.id
                 )
 
             # Get previous messages from this conversation
             history_limit = max_messages - len(messages)
-            history_messages = self.db.get_conversation_messages(
+            history_messages = await self.db.get_conversation_messages(
                 conversation_id, limit=history_limit
             )
 
             # Format the conversation as a clear chronological sequence
             if history_messages:
                 # First, store the current messages in the database
-                for msg in reversed(immediate_messages):
-                    role = msg["role"]
-                    content = msg["content"]
-                    has_images = isinstance(content, list) and any(
-                        item.get("type") == "image_url" for item in content
-                    )
-                    if has_images:
-                        # For messages with images, extract just the text part
-                        text_content = next(
-                            (
-                                item["text"]
-                                for item in content
-                                if item.get("type") == "text"
-                            ),
-                            "",
-                        )
-                        self.db.add_message(
-                            conversation_id,
-                            role,
-                            text_content,
-                            discord_message_id=start_msg.id,
-                            has_images=True,
-                        )
-                    else:
-                        self.db.add_message(
-                            conversation_id,
-                            role,
-                            content,
-                            discord_message_id=start_msg.id,
-                        )
+                await self._store_messages(
+                    conversation_id, immediate_messages, start_msg.id
+                )
 
                 # Format the conversation history in a clear way
                 conversation_summary = []
@@ -378,73 +417,24 @@ class LLMCordClient(discord.Client):
                 )
             else:
                 # No history, just store the current messages
-                for msg in reversed(immediate_messages):
-                    role = msg["role"]
-                    content = msg["content"]
-                    has_images = isinstance(content, list) and any(
-                        item.get("type") == "image_url" for item in content
-                    )
-                    if has_images:
-                        text_content = next(
-                            (
-                                item["text"]
-                                for item in content
-                                if item.get("type") == "text"
-                            ),
-                            "",
-                        )
-                        self.db.add_message(
-                            conversation_id,
-                            role,
-                            text_content,
-                            discord_message_id=start_msg.id,
-                            has_images=True,
-                        )
-                    else:
-                        self.db.add_message(
-                            conversation_id,
-                            role,
-                            content,
-                            discord_message_id=start_msg.id,
-                        )
+                await self._store_messages(
+                    conversation_id, immediate_messages, start_msg.id
+                )
         else:
             # Start a new conversation
             user_id = start_msg.author.id
             guild_id = start_msg.guild.id if start_msg.guild else None
-            conversation_id = self.db.create_conversation(
+            conversation_id = await self.db.create_conversation(
                 user_id, guild_id, start_msg.channel.id
             )
 
             # Store the current messages
-            for msg in reversed(immediate_messages):
-                role = msg["role"]
-                content = msg["content"]
-                has_images = isinstance(content, list) and any(
-                    item.get("type") == "image_url" for item in content
-                )
-                if has_images:
-                    text_content = next(
-                        (
-                            item["text"]
-                            for item in content
-                            if item.get("type") == "text"
-                        ),
-                        "",
-                    )
-                    self.db.add_message(
-                        conversation_id,
-                        role,
-                        text_content,
-                        discord_message_id=start_msg.id,
-                        has_images=True,
-                    )
-                else:
-                    self.db.add_message(
-                        conversation_id, role, content, discord_message_id=start_msg.id
-                    )
+            await self._store_messages(
+                conversation_id, immediate_messages, start_msg.id
+            )
 
         # Log the complete message chain for debugging
-        logging.info(f"Complete message chain being sent to LLM:")
+        logging.info("Complete message chain being sent to LLM:")
         for idx, msg in enumerate(messages):
             role = msg.get("role", "unknown")
             content = msg.get("content", "")
@@ -462,16 +452,41 @@ class LLMCordClient(discord.Client):
             if len(content) > 500:
                 content = content[:500] + "... [truncated]"
 
-            logging.info(f"  [{idx}] {role}: {content}")
+            logging.info("  [%d] %s: %s", idx, role, content)
 
         return messages, warnings
 
+    async def _store_messages(
+        self,
+        conversation_id: int,
+        immediate_messages: List[Dict[str, Any]],
+        discord_message_id: int,
+    ):
+        """Store the messages of a chain, oldest first, in one database write."""
+        rows = []
+        for msg in reversed(immediate_messages):
+            content = msg["content"]
+            has_images = isinstance(content, list) and any(
+                item.get("type") == "image_url" for item in content
+            )
+            if has_images:
+                # For messages with images, extract just the text part
+                content = next(
+                    (item["text"] for item in content if item.get("type") == "text"),
+                    "",
+                )
+            rows.append((msg["role"], content, discord_message_id, has_images))
+
+        await self.db.add_messages(conversation_id, rows)
+
     async def process_message_chain(self, message: discord.Message):
         """Process a message chain and generate a response."""
         # Log the incoming message
         logging.info(
-            f"Message received (user ID: {message.author.id}, "
-            f"attachments: {len(message.attachments)}):\n{message.content}"
+            "Message received (user ID: %s, attachments: %d):\n%s",
+            message.author.id,
+            len(message.attachments),
+            message.content,
         )
 
         try:
@@ -499,7 +514,7 @@ class LLMCordClient(discord.Client):
             self.message_store.cleanup()
 
         except Exception as e:
-            logging.exception(f"Error processing message chain: {e}")
+            logging.exception("Error processing message chain: %s", e)
             try:
                 await message.reply(f"An error occurred: {str(e)}")
             except:
@@ -524,11 +539,13 @@ class LLMCordClient(discord.Client):
         warnings_embed = create_embed_for_warnings(warnings)
 
         try:
-            async with original_msg.channel.typing():
-                async for (
-                    content_delta,
-                    curr_finish_reason,
-                ) in self.llm_client.generate_response(messages):
+            async with (
+                original_msg.channel.typing(),
+                aclosing(
+                    buffer_stream(self.llm_client.generate_response(messages))
+                ) as stream,
+            ):
+                async for content_delta, curr_finish_reason in stream:
                     if finish_reason is not None:
                         break
 
@@ -615,7 +632,7 @@ class LLMCordClient(discord.Client):
                                 await new_node.lock.acquire()
                             else:
                                 # Edit existing message
-                                edit_task = asyncio.create_task(
+                                edit_task = create_task(
                                     response_msgs[-1].edit(embed=embed)
                                 )
 
@@ -639,7 +656,7 @@ class LLMCordClient(discord.Client):
                             await new_node.lock.acquire()
 
         except Exception as e:
-            logging.exception(f"Error generating response: {e}")
+            logging.exception("Error generating response: %s", e)
             try:
                 await original_msg.reply(
                     "Sorry, I encountered an error while generating a response."
@@ -651,5 +668,5 @@ class LLMCordClient(discord.Client):
         for response_msg in response_msgs:
             node = self.message_store.get(response_msg.id)
             node.text = "".join(response_contents)
-            if node.lock.locked():
+            if node.is_locked():
                 node.lock.release()
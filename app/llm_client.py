@@ -1,5 +1,7 @@
 import logging
-from datetime import datetime
+import re
+from datetime import date
+from functools import lru_cache
 from typing import Any, AsyncGenerator, Dict, List, Optional, Tuple
 
 from openai import AsyncOpenAI
@@ -7,6 +9,24 @@ from openai import AsyncOpenAI
 from config.config import Config
 
 
+def _compile_tags(tags) -> re.Pattern:
+    """Compile substring tags into one case-insensitive alternation."""
+    return re.compile("|".join(map(re.escape, tags)), re.IGNORECASE)
+
+
+@lru_cache(maxsize=4)
+def _system_prompt_for(day: date, prompt: str, supports_usernames: bool) -> str:
+    """Build the full system prompt, memoized per day and prompt variant."""
+    system_prompt_extras = [f"Today's date: {day.strftime('%B %d %Y')}."]
+
+    if supports_usernames:
+        system_prompt_extras.append(
+            "User's names are their Discord IDs and should be typed as '<@ID>'."
+        )
+
+    return "\n".join([prompt] + system_prompt_extras)
+
+
 class LLMClient:
     """
     Handles communication with the LLM API.
@@ -15,37 +35,53 @@ class LLMClient:
 
     def __init__(self, config: Config):
         self.config = config
+        self._clients: Dict[Tuple[str, str, str], AsyncOpenAI] = {}
+
+        # Match all tags in a single pass instead of one substring scan per tag
+        self._vision_re = _compile_tags(config.VISION_MODEL_TAGS)
+        self._username_providers_re = _compile_tags(
+            config.PROVIDERS_SUPPORTING_USERNAMES
+        )
 
     def get_client(self, provider: str) -> AsyncOpenAI:
-        """Create an OpenAI client for the specified provider."""
+        """
+        Get the OpenAI client for the specified provider.
+        Clients are cached so their HTTP connections are reused across requests.
+        The cache is keyed on the provider's settings as well as its name,
+        so edits picked up by a config reload take effect immediately.
+        """
         base_url = self.config.providers[provider]["base_url"]
         api_key = self.config.providers[provider].get("api_key", "sk-no-key-required")
-        return AsyncOpenAI(base_url=base_url, api_key=api_key)
+        key = (provider, base_url, api_key)
+        client = self._clients.get(key)
+        if client is None:
+            client = AsyncOpenAI(base_url=base_url, api_key=api_key)
+            self._clients[key] = client
+        return client
+
+    async def aclose(self):
+        """Close all cached provider clients."""
+        for client in self._clients.values():
+            await client.close()
+        self._clients.clear()
 
     def model_supports_images(self, model: str) -> bool:
         """Check if the model supports image inputs."""
-        return any(tag in model.lower() for tag in self.config.VISION_MODEL_TAGS)
+        return self._vision_re.search(model) is not None
 
     def provider_supports_usernames(self, provider: str) -> bool:
         """Check if the provider supports the username/name parameter."""
-        return any(
-            p in provider.lower() for p in self.config.PROVIDERS_SUPPORTING_USERNAMES
-        )
+        return self._username_providers_re.search(provider) is not None
 
     def prepare_system_message(self, model: str, provider: str) -> Dict[str, str]:
         """Prepare the system message with appropriate context."""
         if not self.config.system_prompt:
             return {}
 
-        system_prompt_extras = [f"Today's date: {datetime.now().strftime('%B %d %Y')}."]
-
-        if self.provider_supports_usernames(provider):
-            system_prompt_extras.append(
-                "User's names are their Discord IDs and should be typed as '<@ID>'."
-            )
-
-        full_system_prompt = "\n".join(
-            [self.config.system_prompt] + system_prompt_extras
+        full_system_prompt = _system_prompt_for(
+            date.today(),
+            self.config.system_prompt,
+            self.provider_supports_usernames(provider),
         )
         return {"role": "system", "content": full_system_prompt}
 
@@ -86,5 +122,5 @@ class LLMClient:
                     break
 
         except Exception as e:
-            logging.exception(f"Error generating LLM response: {e}")
+            logging.exception("Error generating LLM response: %s", e)
             yield f"Error generating response: {str(e)}", "error"
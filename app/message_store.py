@@ -1,4 +1,5 @@
-from typing import Dict
+from collections import OrderedDict
+from typing import Optional
 
 import discord
 
@@ -9,38 +10,57 @@ from config.config import Config
 class MessageStore:
     """
     Manages the storage and retrieval of message nodes.
-    Implements a cache with size limit to prevent memory leaks.
+    Implements an LRU cache with size limit to prevent memory leaks.
     """
 
     def __init__(self, config: Config):
         self.config = config
-        self.nodes: Dict[int, MsgNode] = {}
+        self.nodes: OrderedDict[int, MsgNode] = OrderedDict()
 
     def get(self, msg_id: int) -> MsgNode:
         """Get a message node, creating it if it doesn't exist."""
-        if msg_id not in self.nodes:
-            self.nodes[msg_id] = MsgNode()
-        return self.nodes[msg_id]
+        node = self.nodes.get(msg_id)
+        if node is None:
+            node = self.nodes[msg_id] = MsgNode()
+            self.cleanup(keep=msg_id)
+        else:
+            self.nodes.move_to_end(msg_id)
+        return node
 
     def set(self, msg_id: int, node: MsgNode):
         """Set a message node."""
         self.nodes[msg_id] = node
+        self.nodes.move_to_end(msg_id)
+        self.cleanup(keep=msg_id)
 
-    def cleanup(self):
-        """Remove oldest message nodes if we exceed the maximum cache size."""
-        if len(self.nodes) > self.config.MAX_MESSAGE_NODES:
-            oldest_keys = sorted(self.nodes.keys())[
-                : len(self.nodes) - self.config.MAX_MESSAGE_NODES
-            ]
-            for key in oldest_keys:
-                try:
-                    # Only remove if we can acquire the lock (no active processing)
-                    if self.nodes[key].lock.locked():
-                        continue
-                    del self.nodes[key]
-                except KeyError:
-                    # Node might have been removed by another process
-                    pass
+    def cleanup(self, keep: Optional[int] = None):
+        """
+        Evict least recently used nodes once the store exceeds its size limit.
+        The node under `keep` is never evicted, so callers can return it safely.
+        """
+        excess = len(self.nodes) - self.config.MAX_MESSAGE_NODES
+        if excess <= 0:
+            return
+
+        # Nodes are kept in recency order, so the oldest ones are at the front
+        evicted = []
+        for key, node in self.nodes.items():
+            if len(evicted) == excess:
+                break
+            # Keep nodes that are still being processed
+            if key != keep and not node.is_locked():
+                evicted.append(key)
+
+        if len(evicted) > len(self.nodes) // 2:
+            # Evicting most of the store (e.g. after MAX_MESSAGE_NODES shrinks),
+            # so copying the survivors beats deleting keys one at a time
+            evicted = set(evicted)
+            self.nodes = OrderedDict(
+                (key, node) for key, node in self.nodes.items() if key not in evicted
+            )
+        else:
+            for key in evicted:
+                del self.nodes[key]
 
     async def build_conversation_chain(
         self, start_msg: discord.Message, max_messages: int
@@ -1,11 +1,12 @@
 import asyncio
+from bisect import insort
 from dataclasses import dataclass, field
 from typing import Any, Dict, List, Literal, Optional
 
 import discord
 
 
-@dataclass
+@dataclass(slots=True)
 class MsgNode:
     """
     Represents a message in the conversation chain.
@@ -23,7 +24,42 @@ class MsgNode:
 
     parent_msg: Optional[discord.Message] = None
 
-    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    # Created on first use, so nodes that are never locked don't carry one.
+    # The first access has to happen on the running event loop.
+    _lock: Optional[asyncio.Lock] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    def is_locked(self) -> bool:
+        """Check whether the node is locked without creating its lock."""
+        return self._lock is not None and self._lock.locked()
+
+    def to_api_message(
+        self, max_text: int, max_images: int, include_name: bool = False
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Build the chat API message for this node, truncated to the given limits.
+        Returns None if the node has nothing to send.
+        """
+        text = self.text[:max_text] if self.text else ""
+        images = self.images[:max_images]
+        if images:
+            content = [{"type": "text", "text": text}, *images] if text else images
+        elif text:
+            content = text
+        else:
+            return None
+
+        message = {"content": content, "role": self.role}
+        if include_name and self.user_id is not None:
+            message["name"] = str(self.user_id)
+        return message
 
 
 class ConversationWarnings:
@@ -31,11 +67,17 @@ class ConversationWarnings:
     Tracks warnings that should be displayed to the user about their conversation.
     """
 
+    __slots__ = ("warnings", "_sorted")
+
     def __init__(self):
         self.warnings = set()
+        # Kept sorted on insert so get_sorted never has to re-sort
+        self._sorted: List[str] = []
 
     def add(self, warning: str):
-        self.warnings.add(warning)
+        if warning not in self.warnings:
+            self.warnings.add(warning)
+            insort(self._sorted, warning)
 
     def get_sorted(self):
-        return sorted(self.warnings)
+        return list(self._sorted)
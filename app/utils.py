@@ -1,6 +1,7 @@
+import asyncio
 import logging
-from base64 import b64encode
-from typing import Any, Dict, List, Optional, Tuple
+from typing import (Any, AsyncIterator, Awaitable, Callable, Dict, List,
+                    Optional, Tuple, TypeVar)
 
 import discord
 import httpx
@@ -8,6 +9,20 @@ import httpx
 from app.models import ConversationWarnings, MsgNode
 from config.config import Config
 
+# pybase64 encodes with SIMD; fall back to the stdlib if it isn't installed
+try:
+    from pybase64 import b64encode_as_string
+except ImportError:
+    from base64 import b64encode
+
+    def b64encode_as_string(data: bytes) -> str:
+        return b64encode(data).decode("ascii")
+
+
+T = TypeVar("T")
+
+_STREAM_END = object()
+
 
 async def extract_message_content(
     msg: discord.Message,
@@ -58,7 +73,7 @@ async def extract_message_content(
             if response.status_code == 200:
                 text_parts.append(response.text)
         except Exception as e:
-            logging.warning(f"Failed to fetch text attachment: {e}")
+            logging.warning("Failed to fetch text attachment: %s", e)
 
     # Create images array for vision models
     images = []
@@ -66,10 +81,10 @@ async def extract_message_content(
         try:
             response = await httpx_client.get(att.url)
             if response.status_code == 200:
-                image_data = f"data:{att.content_type};base64,{b64encode(response.content).decode('utf-8')}"
+                image_data = f"data:{att.content_type};base64,{b64encode_as_string(response.content)}"
                 images.append({"type": "image_url", "image_url": {"url": image_data}})
         except Exception as e:
-            logging.warning(f"Failed to fetch image attachment: {e}")
+            logging.warning("Failed to fetch image attachment: %s", e)
 
     # Check if there are any unsupported attachments
     has_bad_attachments = len(msg.attachments) > sum(
@@ -79,11 +94,22 @@ async def extract_message_content(
     return "\n".join(text_parts), images, has_bad_attachments
 
 
-async def find_parent_message(msg: discord.Message) -> Optional[discord.Message]:
+async def find_parent_message(
+    msg: discord.Message,
+    fetch_message: Optional[
+        Callable[[discord.abc.Messageable, int], Awaitable[discord.Message]]
+    ] = None,
+) -> Optional[discord.Message]:
     """
     Find the parent message of the given message.
     Handles replies, threads, and back-to-back messages.
+    Messages are fetched with fetch_message(channel, id) when it is given.
     """
+    if fetch_message is None:
+
+        async def fetch_message(channel, message_id):
+            return await channel.fetch_message(message_id)
+
     try:
         # Case 1: Direct reply
         if msg.reference and msg.reference.message_id:
@@ -91,13 +117,13 @@ async def find_parent_message(msg: discord.Message) -> Optional[discord.Message]
             if msg.reference.cached_message:
                 return msg.reference.cached_message
             # Otherwise fetch from API
-            return await msg.channel.fetch_message(msg.reference.message_id)
+            return await fetch_message(msg.channel, msg.reference.message_id)
 
         # Case 2: Thread starter message
         if msg.channel.type == discord.ChannelType.public_thread and not msg.reference:
             if msg.channel.starter_message:
                 return msg.channel.starter_message
-            return await msg.channel.parent.fetch_message(msg.channel.id)
+            return await fetch_message(msg.channel.parent, msg.channel.id)
 
         # Case 3: Back-to-back messages in same channel (for DMs or from same author)
         # Only if not already mentioning the bot (which would start a new conversation)
@@ -130,7 +156,7 @@ async def find_parent_message(msg: discord.Message) -> Optional[discord.Message]
         return None
 
     except (discord.NotFound, discord.HTTPException) as e:
-        logging.warning(f"Failed to fetch parent message: {e}")
+        logging.warning("Failed to fetch parent message: %s", e)
         return None
 
 
@@ -179,12 +205,12 @@ def check_permissions(msg: discord.Message, config: Config) -> bool:
     is_good_user = (
         allow_all_users
         or user_id in allowed_user_ids
-        or any(id in allowed_role_ids for id in role_ids)
+        or not role_ids.isdisjoint(allowed_role_ids)
     )
     is_bad_user = (
         not is_good_user
         or user_id in blocked_user_ids
-        or any(id in blocked_role_ids for id in role_ids)
+        or not role_ids.isdisjoint(blocked_role_ids)
     )
 
     # Check if channel is allowed or blocked
@@ -192,10 +218,10 @@ def check_permissions(msg: discord.Message, config: Config) -> bool:
     is_good_channel = (
         config.allow_dms
         if is_dm
-        else allow_all_channels or any(id in allowed_channel_ids for id in channel_ids)
+        else allow_all_channels or not channel_ids.isdisjoint(allowed_channel_ids)
     )
-    is_bad_channel = not is_good_channel or any(
-        id in blocked_channel_ids for id in channel_ids
+    is_bad_channel = not is_good_channel or not channel_ids.isdisjoint(
+        blocked_channel_ids
     )
 
     # User must be good and channel must be good
@@ -245,3 +271,38 @@ def truncate_messages(messages: List[Dict[str, Any]], max_length: int) -> List[s
         chunks.append(current_chunk)
 
     return chunks
+
+
+async def buffer_stream(
+    stream: AsyncIterator[T], maxsize: int = 64
+) -> AsyncIterator[T]:
+    """
+    Consume an async iterator in a background task through a bounded queue.
+    Lets the producer keep reading while the caller is busy with slow work.
+    Exceptions raised by the producer are re-raised after the buffered items.
+    Closing the iterator early stops the producer and closes the source stream.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+
+    async def produce():
+        try:
+            async for item in stream:
+                await queue.put(item)
+        finally:
+            # Release the source (e.g. an open HTTP response) however we got here
+            aclose = getattr(stream, "aclose", None)
+            if aclose is not None:
+                await aclose()
+            # If the consumer cancelled us, nobody is left to read the end marker
+            if not asyncio.current_task().cancelling():
+                await queue.put(_STREAM_END)
+
+    producer = asyncio.ensure_future(produce())
+    try:
+        while (item := await queue.get()) is not _STREAM_END:
+            yield item
+        await producer
+    finally:
+        producer.cancel()
+        # Wait for the producer to unwind; its outcome was already surfaced above
+        await asyncio.gather(producer, return_exceptions=True)
@@ -0,0 +1,17 @@
+import pytest
+
+from app.utils import truncate_messages
+
+pytest.importorskip("pytest_benchmark")
+
+# A long streamed response: 1000 chunks of 500 characters
+_MESSAGES = [{"content": "x" * 500} for _ in range(1000)]
+
+
+def test_truncate_messages_benchmark(benchmark):
+    # Execute
+    result = benchmark(truncate_messages, _MESSAGES, 2000)
+
+    # Verify
+    assert len(result) == 250
+    assert all(len(chunk) == 2000 for chunk in result)
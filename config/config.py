@@ -1,32 +1,94 @@
 import logging
-from typing import Any, Dict
+import os
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Any, Dict, FrozenSet, Mapping
 
 import yaml
 
+# Prefer the LibYAML-backed C parser; fall back to pure Python without libyaml
+try:
+    from yaml import CSafeLoader as _SafeLoader
+except ImportError:
+    from yaml import SafeLoader as _SafeLoader
+
+# Shared, immutable tag sets; the same objects are handed to every Config
+VISION_MODEL_TAGS = frozenset(
+    {
+        "gpt-4",
+        "claude-3",
+        "gemini",
+        "gemma",
+        "pixtral",
+        "mistral-small",
+        "llava",
+        "vision",
+        "vl",
+    }
+)
+PROVIDERS_SUPPORTING_USERNAMES = frozenset({"openai", "x-ai"})
+ALLOWED_FILE_TYPES = frozenset({"image", "text"})
+
+_PERMISSION_SCOPES = ("users", "roles", "channels")
+_PERMISSION_KEYS = ("allowed_ids", "blocked_ids")
+
+# Shared by every config without a permissions section; read-only so it can't
+# be changed through one Config and leak into the others
+_DEFAULT_PERMISSIONS: Mapping[str, Mapping[str, FrozenSet[int]]] = MappingProxyType(
+    {
+        scope: MappingProxyType({key: frozenset() for key in _PERMISSION_KEYS})
+        for scope in _PERMISSION_SCOPES
+    }
+)
+
+
+@lru_cache(maxsize=32)
+def _load_yaml_cached(path: str, mtime_ns: int) -> Dict[str, Any]:
+    """Parse a YAML file, memoized on its path and modification time."""
+    with open(path, "r") as file:
+        return yaml.load(file, Loader=_SafeLoader) or {}
+
 
 class Config:
     """
     Handles loading and accessing configuration data.
+    Settings are snapshotted into plain attributes on every (re)load.
     """
 
+    __slots__ = (
+        "filename",
+        "data",
+        "bot_token",
+        "client_id",
+        "status_message",
+        "max_text",
+        "max_images",
+        "max_messages",
+        "use_plain_responses",
+        "allow_dms",
+        "permissions",
+        "system_prompt",
+        "providers",
+        "model",
+        "extra_api_parameters",
+        "VISION_MODEL_TAGS",
+        "PROVIDERS_SUPPORTING_USERNAMES",
+        "ALLOWED_FILE_TYPES",
+        "EMBED_COLOR_COMPLETE",
+        "EMBED_COLOR_INCOMPLETE",
+        "STREAMING_INDICATOR",
+        "EDIT_DELAY_SECONDS",
+        "MAX_MESSAGE_NODES",
+    )
+
     def __init__(self, filename: str = "config.yaml"):
         self.filename = filename
-        self.data = self.reload()
+        self.reload()
 
         # Constants
-        self.VISION_MODEL_TAGS = (
-            "gpt-4",
-            "claude-3",
-            "gemini",
-            "gemma",
-            "pixtral",
-            "mistral-small",
-            "llava",
-            "vision",
-            "vl",
-        )
-        self.PROVIDERS_SUPPORTING_USERNAMES = ("openai", "x-ai")
-        self.ALLOWED_FILE_TYPES = ("image", "text")
+        self.VISION_MODEL_TAGS = VISION_MODEL_TAGS
+        self.PROVIDERS_SUPPORTING_USERNAMES = PROVIDERS_SUPPORTING_USERNAMES
+        self.ALLOWED_FILE_TYPES = ALLOWED_FILE_TYPES
         self.EMBED_COLOR_COMPLETE = 0x006400  # dark_green
         self.EMBED_COLOR_INCOMPLETE = 0xFFA500  # orange
         self.STREAMING_INDICATOR = " ⚪"
@@ -34,13 +96,56 @@ class Config:
         self.MAX_MESSAGE_NODES = 100
 
     def reload(self) -> Dict[str, Any]:
-        """Reloads the configuration from file."""
+        """
+        Reloads the configuration from file.
+        The file is only re-parsed when its modification time has changed.
+        """
         try:
-            with open(self.filename, "r") as file:
-                return yaml.safe_load(file)
+            mtime_ns = os.stat(self.filename).st_mtime_ns
+            data = _load_yaml_cached(self.filename, mtime_ns)
         except Exception as e:
-            logging.error(f"Error loading configuration: {e}")
-            return {}
+            logging.error("Error loading configuration: %s", e)
+            # Keep serving the last good configuration if there is one
+            data = getattr(self, "data", {})
+
+        if data is not getattr(self, "data", None):
+            self.data = data
+            self._snapshot()
+        return self.data
+
+    def _snapshot(self):
+        """Copy the settings, with defaults applied, into plain attributes."""
+        data = self.data
+        self.bot_token = data.get("bot_token", "")
+        self.client_id = data.get("client_id", "")
+        self.status_message = data.get(
+            "status_message", "github.com/jakobdylanc/llmcord"
+        )
+        self.max_text = data.get("max_text", 100000)
+        self.max_images = data.get("max_images", 5)
+        self.max_messages = data.get("max_messages", 25)
+        self.use_plain_responses = data.get("use_plain_responses", False)
+        self.allow_dms = data.get("allow_dms", True)
+        self.permissions = self._freeze_permissions(data.get("permissions") or {})
+        self.system_prompt = data.get("system_prompt", "")
+        self.providers = data.get("providers", {})
+        self.model = data.get("model", "")
+        self.extra_api_parameters = data.get("extra_api_parameters", {})
+
+    @staticmethod
+    def _freeze_permissions(
+        permissions: Dict[str, Any],
+    ) -> Mapping[str, Mapping[str, FrozenSet[int]]]:
+        """Normalize the permission ID lists into frozensets for O(1) lookups."""
+        if not permissions:
+            return _DEFAULT_PERMISSIONS
+        return {
+            scope: {
+                key: frozenset((permissions.get(scope) or {}).get(key) or ())
+                for key in _PERMISSION_KEYS
+            }
+            for scope in _PERMISSION_SCOPES
+        }
 
     def get(self, key: str, default=None):
         """Get a configuration value with an optional default."""
@@ -49,62 +154,3 @@ class Config:
     def __getitem__(self, key: str):
         """Allow dict-like access to configuration."""
         return self.data[key]
-
-    @property
-    def bot_token(self) -> str:
-        return self.data.get("bot_token", "")
-
-    @property
-    def client_id(self) -> str:
-        return self.data.get("client_id", "")
-
-    @property
-    def status_message(self) -> str:
-        return self.data.get("status_message", "github.com/jakobdylanc/llmcord")
-
-    @property
-    def max_text(self) -> int:
-        return self.data.get("max_text", 100000)
-
-    @property
-    def max_images(self) -> int:
-        return self.data.get("max_images", 5)
-
-    @property
-    def max_messages(self) -> int:
-        return self.data.get("max_messages", 25)
-
-    @property
-    def use_plain_responses(self) -> bool:
-        return self.data.get("use_plain_responses", False)
-
-    @property
-    def allow_dms(self) -> bool:
-        return self.data.get("allow_dms", True)
-
-    @property
-    def permissions(self) -> Dict[str, Any]:
-        return self.data.get(
-            "permissions",
-            {
-                "users": {"allowed_ids": [], "blocked_ids": []},
-                "roles": {"allowed_ids": [], "blocked_ids": []},
-                "channels": {"allowed_ids": [], "blocked_ids": []},
-            },
-        )
-
-    @property
-    def system_prompt(self) -> str:
-        return self.data.get("system_prompt", "")
-
-    @property
-    def providers(self) -> Dict[str, Dict[str, str]]:
-        return self.data.get("providers", {})
-
-    @property
-    def model(self) -> str:
-        return self.data.get("model", "")
-
-    @property
-    def extra_api_parameters(self) -> Dict[str, Any]:
-        return self.data.get("extra_api_parameters", {})
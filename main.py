@@ -1,18 +1,20 @@
 import asyncio
 import logging
 import os
+import signal
 
-from app.database import Database
+from app.database import DEFAULT_DB_PATH, create_pool
 from app.discord_client import LLMCordClient
 from config.config import Config
 
 
 async def main():
     """Main entry point for the LLMCord bot."""
-    # Configure logging
+    # Configure logging, replacing any handler an imported library installed first
     logging.basicConfig(
         level=logging.INFO,
         format="%(asctime)s %(levelname)s: %(message)s",
+        force=True,
     )
 
     # Load configuration
@@ -25,20 +27,33 @@ async def main():
         )
         return
 
-    # Initialize database
-    db = Database()
+    # Initialize the database connection pool
+    db_path = os.environ.get("DB_PATH", DEFAULT_DB_PATH)
+    pool = await create_pool(db_path, min_size=1, max_size=8)
     logging.info("Database initialized")
 
     # Initialize and run the Discord client
-    client = LLMCordClient(config)
+    client = LLMCordClient(config, db_pool=pool)
+
+    # Cancel the main task on SIGTERM/SIGINT so the finally block always runs
+    main_task = asyncio.current_task()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, main_task.cancel)
+        except NotImplementedError:
+            # Signal handlers aren't supported by the Windows event loop
+            pass
 
     try:
         await client.start(config.bot_token)
-    except KeyboardInterrupt:
+    except (KeyboardInterrupt, asyncio.CancelledError):
         logging.info("Bot shutting down...")
-        await client.close()
     except Exception as e:
-        logging.exception(f"Error starting bot: {e}")
+        logging.exception("Error starting bot: %s", e)
+    finally:
+        # Closes the Discord connection, HTTP/LLM clients and the database pool
+        await client.close()
 
 
 if __name__ == "__main__":
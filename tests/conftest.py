@@ -1,15 +1,82 @@
 import asyncio
+from dataclasses import dataclass, field, fields
+from typing import Any, Dict, FrozenSet
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import discord
 import httpx
 import pytest
+import pytest_asyncio
 
-from app.database import Database
+from app.database import ConnectionPool, Database
 from app.discord_client import LLMCordClient
 from app.llm_client import LLMClient
 from app.message_store import MessageStore
-from config.config import Config
+from config.config import (ALLOWED_FILE_TYPES, PROVIDERS_SUPPORTING_USERNAMES,
+                           VISION_MODEL_TAGS)
+from tests.fakes import FakeHttpClient, FakeMessage, FakeNode
+
+
+@dataclass(slots=True)
+class FakeConfig:
+    """
+    Plain-attribute stand-in for Config.
+    Mirrors Config's public surface without MagicMock's per-access bookkeeping.
+    Not frozen, since tests tweak individual settings.
+    """
+
+    bot_token: str = ""
+    client_id: str = ""
+    status_message: str = "github.com/jakobdylanc/llmcord"
+    max_text: int = 100000
+    max_images: int = 5
+    max_messages: int = 25
+    use_plain_responses: bool = False
+    allow_dms: bool = True
+    permissions: Dict[str, Any] = field(
+        default_factory=lambda: {
+            "users": {"allowed_ids": [], "blocked_ids": []},
+            "roles": {"allowed_ids": [], "blocked_ids": []},
+            "channels": {"allowed_ids": [], "blocked_ids": []},
+        }
+    )
+    system_prompt: str = ""
+    providers: Dict[str, Dict[str, str]] = field(default_factory=dict)
+    model: str = ""
+    extra_api_parameters: Dict[str, Any] = field(default_factory=dict)
+
+    # Constants
+    VISION_MODEL_TAGS: FrozenSet[str] = VISION_MODEL_TAGS
+    PROVIDERS_SUPPORTING_USERNAMES: FrozenSet[str] = PROVIDERS_SUPPORTING_USERNAMES
+    ALLOWED_FILE_TYPES: FrozenSet[str] = ALLOWED_FILE_TYPES
+    EMBED_COLOR_COMPLETE: int = 0x006400  # dark_green
+    EMBED_COLOR_INCOMPLETE: int = 0xFFA500  # orange
+    STREAMING_INDICATOR: str = " ⚪"
+    EDIT_DELAY_SECONDS: int = 1
+    MAX_MESSAGE_NODES: int = 100
+
+    def reload(self) -> Dict[str, Any]:
+        """Return the current settings; there is no file to re-read."""
+        return {f.name: getattr(self, f.name) for f in fields(self)}
+
+    def get(self, key: str, default=None):
+        """Get a configuration value with an optional default."""
+        return getattr(self, key, default)
+
+    def __getitem__(self, key: str):
+        """Allow dict-like access to configuration."""
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+
+def pytest_collection_modifyitems(items):
+    """Run every async test on the shared session event loop."""
+    session_loop = pytest.mark.asyncio(loop_scope="session")
+    for item in items:
+        if pytest_asyncio.is_async_test(item):
+            item.add_marker(session_loop, append=False)
 
 
 @pytest.fixture
@@ -48,66 +115,16 @@ def test_config():
         "extra_api_parameters": {"max_tokens": 2048, "temperature": 0.7},
     }
 
-    # Create a mock Config object
-    mock_config = MagicMock(spec=Config)
-
-    # Set attributes on the mock
-    for key, value in config_dict.items():
-        setattr(mock_config, key, value)
-
-    # Set properties that the code accesses via properties
-    mock_config.bot_token = config_dict["bot_token"]
-    mock_config.client_id = config_dict["client_id"]
-    mock_config.status_message = config_dict["status_message"]
-    mock_config.max_text = config_dict["max_text"]
-    mock_config.max_images = config_dict["max_images"]
-    mock_config.max_messages = config_dict["max_messages"]
-    mock_config.use_plain_responses = config_dict["use_plain_responses"]
-    mock_config.allow_dms = config_dict["allow_dms"]
-    mock_config.permissions = config_dict["permissions"]
-    mock_config.system_prompt = config_dict["system_prompt"]
-    mock_config.providers = config_dict["providers"]
-    mock_config.model = config_dict["model"]
-    mock_config.extra_api_parameters = config_dict["extra_api_parameters"]
-
-    # Constants
-    mock_config.VISION_MODEL_TAGS = (
-        "gpt-4",
-        "claude-3",
-        "gemini",
-        "gemma",
-        "pixtral",
-        "mistral-small",
-        "llava",
-        "vision",
-        "vl",
-    )
-    mock_config.PROVIDERS_SUPPORTING_USERNAMES = ("openai", "x-ai")
-    mock_config.ALLOWED_FILE_TYPES = ("image", "text")
-    mock_config.EMBED_COLOR_COMPLETE = 0x006400  # dark_green
-    mock_config.EMBED_COLOR_INCOMPLETE = 0xFFA500  # orange
-    mock_config.STREAMING_INDICATOR = " ⚪"
-    mock_config.EDIT_DELAY_SECONDS = 1
-    mock_config.MAX_MESSAGE_NODES = 100
-
-    # Add the reload method
-    mock_config.reload.return_value = config_dict
-
-    # Add the get method
-    mock_config.get.side_effect = lambda key, default=None: config_dict.get(
-        key, default
-    )
+    return FakeConfig(**config_dict)
 
-    # Add dict-like access
-    mock_config.__getitem__.side_effect = lambda key: config_dict[key]
 
-    return mock_config
-
-
-@pytest.fixture
-def db(temp_db_path):
+@pytest_asyncio.fixture
+async def db(temp_db_path):
     """Fixture that provides a test database instance."""
-    return Database(temp_db_path)
+    db = Database(ConnectionPool(temp_db_path))
+    await db.connect()
+    yield db
+    await db.close()
 
 
 @pytest.fixture
@@ -124,72 +141,155 @@ def llm_client(test_config):
 
 @pytest.fixture
 def mock_discord_message():
-    """Fixture that provides a mock Discord message."""
-    mock_msg = MagicMock(spec=discord.Message)
-    mock_msg.id = 123456789
-    mock_msg.content = "Hello, bot!"
-    mock_msg.attachments = []
-    mock_msg.embeds = []
-    mock_msg.author = MagicMock(spec=discord.Member)
-    mock_msg.author.id = 111
-    mock_msg.author.bot = False
-    mock_msg.author.name = "TestUser"
-    mock_msg.channel = MagicMock(spec=discord.TextChannel)
-    mock_msg.channel.id = 777
-    mock_msg.channel.type = discord.ChannelType.text
-    mock_msg.guild = MagicMock(spec=discord.Guild)
-    mock_msg.guild.id = 888
-    mock_msg.guild.me = MagicMock(spec=discord.Member)
-    mock_msg.guild.me.id = 999
-    mock_msg.reference = None
-    mock_msg.reply = AsyncMock()
-
-    return mock_msg
+    """Fixture that provides a fake Discord message."""
+    return FakeMessage()
+
+
+@pytest.fixture
+def mock_dm_message():
+    """Fixture that provides a fake Discord DM, with no guild."""
+    return FakeMessage(dm=True)
+
+
+@pytest.fixture(scope="session")
+def _discord_spec_names():
+    """
+    Attribute names of the mocked discord classes, introspected once per session.
+    A name list gives the same attribute checking as spec=<class> without
+    re-inspecting the class for every mock.
+    """
+    return {
+        cls: dir(cls) for cls in (discord.Attachment, discord.Embed, discord.Message)
+    }
+
+
+def _spec_mock_factory(names):
+    def make(**attrs):
+        return MagicMock(spec=names, **attrs)
+
+    return make
+
+
+@pytest.fixture
+def mock_attachment_factory(_discord_spec_names):
+    """Fixture that builds discord.Attachment mocks with the given attributes."""
+    return _spec_mock_factory(_discord_spec_names[discord.Attachment])
+
+
+@pytest.fixture
+def mock_embed_factory(_discord_spec_names):
+    """Fixture that builds discord.Embed mocks with the given attributes."""
+    return _spec_mock_factory(_discord_spec_names[discord.Embed])
+
+
+@pytest.fixture
+def mock_message_factory(_discord_spec_names):
+    """Fixture that builds discord.Message mocks with the given attributes."""
+    return _spec_mock_factory(_discord_spec_names[discord.Message])
+
+
+@pytest.fixture
+def locked_node():
+    """Fixture that provides a message node whose lock never blocks."""
+    return FakeNode()
+
+
+@pytest.fixture
+def async_gen_factory():
+    """
+    Fixture that builds fake generate_response functions.
+    The returned function yields the given (content, finish_reason) pairs,
+    then raises error if one is given.
+    """
+
+    def make(pairs, error=None):
+        async def generate_response(messages):
+            for content, finish_reason in pairs:
+                yield content, finish_reason
+            if error is not None:
+                raise error
+
+        return generate_response
+
+    return make
+
+
+@pytest.fixture(scope="session")
+def _response_spec_names():
+    """Attribute names of httpx.Response, introspected once per session."""
+    return dir(httpx.Response)
+
+
+@pytest.fixture
+def mock_response(_response_spec_names):
+    """Fixture that provides a mock successful httpx response."""
+    return MagicMock(spec=_response_spec_names, status_code=200)
 
 
 @pytest.fixture
 def mock_client():
-    """Fixture that provides a mock httpx client."""
-    mock = AsyncMock(spec=httpx.AsyncClient)
-    return mock
+    """Fixture that provides a fake httpx client with a mocked get."""
+    return FakeHttpClient()
 
 
 @pytest.fixture(scope="session")
 def event_loop_policy():
-    """Return an event loop policy for all tests."""
-    return asyncio.DefaultEventLoopPolicy()
+    """Return an event loop policy for all tests, preferring uvloop when available."""
+    try:
+        import uvloop
+    except ImportError:
+        # uvloop isn't available on Windows
+        return asyncio.DefaultEventLoopPolicy()
+    return uvloop.EventLoopPolicy()
 
 
-@pytest.fixture
-def discord_client(test_config):
-    """Fixture that provides a test Discord client instance."""
+@pytest.fixture(scope="session")
+def _shared_discord_client():
+    """
+    Build the test Discord client once per session.
+    Returns the client and the user property installed on it.
+    """
     # Patch discord.Client.__init__ to prevent actual initialization
     with patch("discord.Client.__init__", return_value=None):
-        client = LLMCordClient(test_config)
+        client = LLMCordClient(FakeConfig(), db_pool=ConnectionPool(":memory:"))
+
+    # Create mocks for client properties
+    client._connection = MagicMock()
+    client.http = MagicMock()  # Add this for app_commands.CommandTree
+
+    # Instead of trying to set the user property directly, we'll
+    # create a mock user and patch the user property to return it
+    mock_user = MagicMock(spec=discord.ClientUser)
+    mock_user.id = 999
+    mock_user.mention = "<@999>"
+    user_property = property(lambda self: mock_user)
 
-        # Create mocks for client properties
-        client._connection = MagicMock()
-        client.http = MagicMock()  # Add this for app_commands.CommandTree
+    # Mock setup_hook to prevent it from being called during tests
+    client.setup_hook = AsyncMock()
 
-        # Set up a mock tree - this is now set in setup_hook
-        client.tree = MagicMock()
+    return client, user_property
+
+
+@pytest.fixture
+def discord_client(_shared_discord_client, test_config):
+    """Fixture that provides the shared test Discord client with fresh mocks."""
+    client, user_property = _shared_discord_client
 
-        # Instead of trying to set the user property directly, we'll
-        # create a mock user and patch the user property to return it
-        mock_user = MagicMock(spec=discord.ClientUser)
-        mock_user.id = 999
-        mock_user.mention = "<@999>"
+    # Reset everything tests are allowed to modify
+    client.config = test_config
+    client.last_task_time = 0
+    client._invite_url = None
 
-        # Use property() to mock the user property
-        type(client).user = property(lambda self: mock_user)
+    # Set up a mock tree - this is now set in setup_hook
+    client.tree = MagicMock()
 
-        # Mock http_client, llm_client, message_store, and db
-        client.http_client = AsyncMock()
-        client.llm_client = AsyncMock()
-        client.message_store = MagicMock(spec=MessageStore)
-        client.db = AsyncMock()
+    # Use property() to mock the user property; tests may replace it
+    type(client).user = user_property
 
-        # Mock setup_hook to prevent it from being called during tests
-        client.setup_hook = AsyncMock()
+    # Mock http_client, llm_client, message_store, and db
+    client.http_client = AsyncMock()
+    client.llm_client = AsyncMock(spec=LLMClient)
+    client.message_store = MagicMock(spec=MessageStore)
+    client.db = AsyncMock()
 
-        return client
+    return client
@@ -0,0 +1,138 @@
+from contextlib import nullcontext
+from unittest.mock import AsyncMock
+
+import discord
+
+
+async def async_iter(items):
+    """Async iterator over items, e.g. as the result of channel.history()."""
+    for item in items:
+        yield item
+
+
+class FakeUser:
+    """Plain stand-in for discord.User/discord.Member."""
+
+    __slots__ = ("id", "bot", "name", "mention", "roles")
+
+    def __init__(self, id: int = 111, bot: bool = False, name: str = "TestUser"):
+        self.id = id
+        self.bot = bot
+        self.name = name
+        self.mention = f"<@{id}>"
+        self.roles = []
+
+
+class FakeChannel:
+    """Plain stand-in for discord.TextChannel."""
+
+    __slots__ = ("id", "type", "parent_id", "category_id")
+
+    def __init__(self, id: int = 777, type=discord.ChannelType.text):
+        self.id = id
+        self.type = type
+        self.parent_id = None
+        self.category_id = None
+
+    def typing(self):
+        """Typing indicator context manager; does nothing in tests."""
+        return nullcontext()
+
+
+class FakeGuild:
+    """Plain stand-in for discord.Guild."""
+
+    __slots__ = ("id", "me")
+
+    def __init__(self, id: int = 888, me: FakeUser = None):
+        self.id = id
+        self.me = me if me is not None else FakeUser(999, bot=True, name="Bot")
+
+
+class FakeMessage:
+    """
+    Plain stand-in for discord.Message.
+    Only reply is a mock, since it's the method tests assert against.
+    """
+
+    __slots__ = (
+        "id",
+        "content",
+        "attachments",
+        "embeds",
+        "author",
+        "channel",
+        "guild",
+        "mentions",
+        "reference",
+        "reply",
+        "edit",
+    )
+
+    def __init__(
+        self, id: int = 123456789, content: str = "Hello, bot!", dm: bool = False
+    ):
+        self.id = id
+        self.content = content
+        self.attachments = []
+        self.embeds = []
+        self.author = FakeUser()
+        if dm:
+            # DMs have no guild to build
+            self.channel = FakeChannel(type=discord.ChannelType.private)
+            self.guild = None
+        else:
+            self.channel = FakeChannel()
+            self.guild = FakeGuild()
+        self.mentions = []
+        self.reference = None
+        self.reply = AsyncMock()
+        # Only set by tests that edit the message
+        self.edit = None
+
+
+class FakeInteraction:
+    """Plain stand-in for discord.Interaction with a mocked response."""
+
+    __slots__ = ("user", "response")
+
+    def __init__(self, user_id: int = 12345):
+        self.user = FakeUser(user_id)
+        self.response = AsyncMock()
+
+
+class FakeHttpClient:
+    """Plain stand-in for httpx.AsyncClient; only get is used by the app."""
+
+    __slots__ = ("get",)
+
+    def __init__(self):
+        self.get = AsyncMock()
+
+
+class FakeLock:
+    """Stand-in for asyncio.Lock that never blocks and is never held."""
+
+    __slots__ = ()
+
+    async def acquire(self):
+        return True
+
+    def release(self):
+        pass
+
+    def locked(self):
+        return False
+
+
+class FakeNode:
+    """Plain stand-in for MsgNode with a no-op lock."""
+
+    __slots__ = ("text", "lock")
+
+    def __init__(self):
+        self.text = None
+        self.lock = FakeLock()
+
+    def is_locked(self):
+        return False
@@ -1,9 +1,12 @@
+import asyncio
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import discord
 import pytest
 
+from app.database import ConnectionPool
 from app.discord_client import LLMCordClient
+from app.llm_client import LLMClient
 from app.message_store import MessageStore
 from app.models import ConversationWarnings, MsgNode
 
@@ -11,11 +14,11 @@ from app.models import ConversationWarnings, MsgNode
 class TestLLMCordClient:
 
     @pytest.fixture
-    def discord_client(self, test_config):
+    def discord_client(self, test_config, temp_db_path):
         """Fixture that provides a test Discord client instance."""
         # Patch discord.Client.__init__ to prevent actual initialization
         with patch("discord.Client.__init__", return_value=None):
-            client = LLMCordClient(test_config)
+            client = LLMCordClient(test_config, db_pool=ConnectionPool(temp_db_path))
 
             # Create a mock for _connection
             client._connection = MagicMock()
@@ -31,13 +34,12 @@ class TestLLMCordClient:
 
             # Mock http_client, llm_client, message_store, and db
             client.http_client = AsyncMock()
-            client.llm_client = AsyncMock()
+            client.llm_client = AsyncMock(spec=LLMClient)
             client.message_store = MagicMock(spec=MessageStore)
             client.db = AsyncMock()
 
             return client
 
-    @pytest.mark.asyncio
     async def test_on_ready(self, discord_client):
         # Setup
         mock_user = MagicMock()
@@ -51,25 +53,93 @@ class TestLLMCordClient:
         with patch("logging.info") as mock_log:
             await discord_client.on_ready()
 
+        # Render the lazily formatted log records
+        logged = [args[0] % args[1:] for args, _ in mock_log.call_args_list]
+
         # Verify - use partial matching since MagicMock has a dynamic string representation
         # Check that some call contained both "Logged in as" and "(ID: 12345)"
-        login_call_found = False
-        for call_args in mock_log.call_args_list:
-            arg = call_args[0][0]
-            if isinstance(arg, str) and "Logged in as" in arg and "(ID: 12345)" in arg:
-                login_call_found = True
-                break
+        login_call_found = any(
+            "Logged in as" in msg and "(ID: 12345)" in msg for msg in logged
+        )
 
         assert login_call_found, "No login message found with correct user ID"
 
         # Still check the exact URL message
-        mock_log.assert_any_call(
+        assert (
             "\n\nBOT INVITE URL:\n"
-            f"https://discord.com/api/oauth2/authorize?client_id=67890"
-            f"&permissions=412317273088&scope=bot%20applications.commands\n"
+            "https://discord.com/api/oauth2/authorize?client_id=67890"
+            "&permissions=412317273088&scope=bot%20applications.commands\n"
+        ) in logged
+
+    async def test_on_ready_caches_invite_url(self, discord_client):
+        # Setup
+        discord_client.config.client_id = "67890"
+
+        # Execute
+        with patch("logging.info"):
+            await discord_client.on_ready()
+            invite_url = discord_client._invite_url
+            await discord_client.on_ready()
+
+        # Verify - the URL is built once and reused on reconnect
+        assert "client_id=67890" in invite_url
+        assert discord_client._invite_url is invite_url
+
+    async def test_close(self, discord_client):
+        # Execute
+        with patch("discord.Client.close", new_callable=AsyncMock) as mock_close:
+            await discord_client.close()
+
+        # Verify - the Discord connection, shared clients and database are all closed
+        mock_close.assert_called_once()
+        discord_client.http_client.aclose.assert_called_once()
+        discord_client.llm_client.aclose.assert_called_once()
+        discord_client.db.close.assert_called_once()
+
+    async def test_setup_hook(self, discord_client):
+        # Setup
+        provider_client = MagicMock()
+        provider_client.models.list = AsyncMock()
+        discord_client.llm_client.get_client = MagicMock(return_value=provider_client)
+
+        # Execute
+        with patch("app.discord_client.app_commands.CommandTree") as mock_tree_cls:
+            mock_tree_cls.return_value.sync = AsyncMock()
+            await discord_client.setup_hook()
+
+        # Verify - both slash commands were registered on the tree
+        registered = [
+            call.args[0]
+            for call in mock_tree_cls.return_value.add_command.call_args_list
+        ]
+        assert [command.name for command in registered] == ["reset", "stats"]
+        assert all(command.binding is discord_client for command in registered)
+
+        # Verify - database, command sync and provider warm-up all ran
+        discord_client.db.connect.assert_awaited_once()
+        mock_tree_cls.return_value.sync.assert_awaited_once()
+        discord_client.llm_client.get_client.assert_called_once_with("openai")
+        provider_client.models.list.assert_awaited_once()
+
+    async def test_setup_hook_provider_down(self, discord_client):
+        # Setup
+        provider_client = MagicMock()
+        provider_client.models.list = AsyncMock(
+            side_effect=Exception("Connection refused")
         )
+        discord_client.llm_client.get_client = MagicMock(return_value=provider_client)
+
+        # Execute - a failed warm-up must not abort startup
+        with patch("app.discord_client.app_commands.CommandTree") as mock_tree_cls:
+            mock_tree_cls.return_value.sync = AsyncMock()
+            with patch("logging.warning") as mock_warning:
+                await discord_client.setup_hook()
+
+        # Verify
+        discord_client.db.connect.assert_awaited_once()
+        mock_tree_cls.return_value.sync.assert_awaited_once()
+        mock_warning.assert_called_once()
 
-    @pytest.mark.asyncio
     async def test_on_message_bot_message(self, discord_client, mock_discord_message):
         # Setup - Bot message should be ignored
         mock_discord_message.author.bot = True
@@ -84,7 +154,6 @@ class TestLLMCordClient:
             # Verify - No further processing should occur
             mock_process.assert_not_called()
 
-    @pytest.mark.asyncio
     async def test_on_message_no_mention_no_dm(
         self, discord_client, mock_discord_message
     ):
@@ -104,7 +173,6 @@ class TestLLMCordClient:
             # Verify - No processing should occur
             mock_process.assert_not_called()
 
-    @pytest.mark.asyncio
     async def test_on_message_with_mention(self, discord_client, mock_discord_message):
         # Setup - Message with bot mention
         mock_discord_message.author.bot = False
@@ -136,25 +204,19 @@ class TestLLMCordClient:
                 # Verify
                 mock_process.assert_called_once_with(mock_discord_message)
 
-    @pytest.mark.asyncio
-    async def test_on_message_in_dm(self, discord_client, mock_discord_message):
-        # Setup - DM message
-        mock_discord_message.author.bot = False
-        mock_discord_message.channel.type = discord.ChannelType.private
-        mock_discord_message.mentions = []  # No mentions needed in DMs
-
+    async def test_on_message_in_dm(self, discord_client, mock_dm_message):
+        # Setup - DM message, no mentions needed
         # Mock check_permissions to return True and process_message_chain
         with patch("app.discord_client.check_permissions", return_value=True):
             with patch.object(
                 discord_client, "process_message_chain", new_callable=AsyncMock
             ) as mock_process:
                 # Execute
-                await discord_client.on_message(mock_discord_message)
+                await discord_client.on_message(mock_dm_message)
 
                 # Verify
-                mock_process.assert_called_once_with(mock_discord_message)
+                mock_process.assert_called_once_with(mock_dm_message)
 
-    @pytest.mark.asyncio
     async def test_on_message_insufficient_permissions(
         self, discord_client, mock_discord_message
     ):
@@ -174,7 +236,6 @@ class TestLLMCordClient:
                 # Verify - No processing should occur
                 mock_process.assert_not_called()
 
-    @pytest.mark.asyncio
     async def test_process_message_node(self, discord_client, mock_discord_message):
         # Setup
         node = MsgNode()
@@ -210,7 +271,79 @@ class TestLLMCordClient:
                 assert node.user_id == mock_discord_message.author.id
                 assert node.parent_msg is parent_msg
 
-    @pytest.mark.asyncio
+    async def test_process_message_node_fetches_concurrently(
+        self, discord_client, mock_discord_message
+    ):
+        # Setup - content extraction only finishes once the parent lookup has started
+        node = MsgNode()
+        parent_lookup_started = asyncio.Event()
+
+        async def mock_extract(*args):
+            await parent_lookup_started.wait()
+            return ("Hello", [], False)
+
+        async def mock_find_parent(msg, fetch_message):
+            parent_lookup_started.set()
+            return None
+
+        with patch("app.discord_client.extract_message_content", mock_extract):
+            with patch("app.discord_client.find_parent_message", mock_find_parent):
+                # Execute - would time out if the two ran one after the other
+                await asyncio.wait_for(
+                    discord_client.process_message_node(mock_discord_message, node),
+                    timeout=1,
+                )
+
+        # Verify
+        assert node.text == "Hello"
+
+    async def test_process_message_node_cancels_lookup_on_error(
+        self, discord_client, mock_discord_message
+    ):
+        # Setup - content extraction fails while the parent lookup is pending
+        node = MsgNode()
+        lookup_cancelled = asyncio.Event()
+
+        async def mock_find_parent(msg, fetch_message):
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                lookup_cancelled.set()
+                raise
+
+        async def mock_extract(*args):
+            await asyncio.sleep(0)  # Let the lookup start first
+            raise ValueError("Bad attachment")
+
+        with patch("app.discord_client.extract_message_content", mock_extract):
+            with patch("app.discord_client.find_parent_message", mock_find_parent):
+                # Execute
+                with pytest.raises(ValueError, match="Bad attachment"):
+                    await discord_client.process_message_node(
+                        mock_discord_message, node
+                    )
+
+        # Verify - the lookup was cancelled rather than left running
+        assert lookup_cancelled.is_set()
+
+    async def test_fetch_message_cached_coalesces(self, discord_client):
+        # Setup
+        channel = MagicMock()
+        channel.id = 1
+        parent_msg = MagicMock(spec=discord.Message)
+        channel.fetch_message = AsyncMock(return_value=parent_msg)
+
+        # Execute - two chain walks need the same message at once
+        results = await asyncio.gather(
+            discord_client.fetch_message_cached(channel, 12345),
+            discord_client.fetch_message_cached(channel, 12345),
+        )
+
+        # Verify - one request served both, and nothing is left pending
+        assert results == [parent_msg, parent_msg]
+        channel.fetch_message.assert_awaited_once_with(12345)
+        assert discord_client._pending_fetches == {}
+
     async def test_process_message_node_bot_message(
         self, discord_client, mock_discord_message
     ):
@@ -232,7 +365,6 @@ class TestLLMCordClient:
             assert node.role == "assistant"  # Since message is from the bot
             assert node.user_id is None  # Bot doesn't have a user_id
 
-    @pytest.mark.asyncio
     async def test_process_message_node_with_parent_reference(
         self, discord_client, mock_discord_message
     ):
@@ -260,7 +392,6 @@ class TestLLMCordClient:
                 assert node.parent_msg is None
                 assert node.fetch_parent_failed is True
 
-    @pytest.mark.asyncio
     async def test_build_message_chain(self, discord_client, mock_discord_message):
         # This test is more complex and would require extensive mocking
         # Here's a partial implementation focusing on key functionality
@@ -300,7 +431,7 @@ class TestLLMCordClient:
         # Mock db functions
         discord_client.db.get_active_conversation = AsyncMock(return_value=None)
         discord_client.db.create_conversation = AsyncMock(return_value=1)
-        discord_client.db.add_message = AsyncMock(return_value=True)
+        discord_client.db.add_messages = AsyncMock(return_value=True)
 
         # Configure LLM client capabilities
         discord_client.llm_client.model_supports_images.return_value = True
@@ -318,3 +449,6 @@ class TestLLMCordClient:
         # Verify message format
         assert isinstance(messages, list)
         assert isinstance(warnings, ConversationWarnings)
+
+        # Verify the chain was stored with a single batched write
+        discord_client.db.add_messages.assert_awaited_once()
@@ -1,6 +1,6 @@
+from datetime import date
 from unittest.mock import AsyncMock, patch
 
-import pytest
 from openai import AsyncOpenAI
 from openai.types.chat import ChatCompletionChunk
 from openai.types.chat.chat_completion_chunk import Choice, ChoiceDelta
@@ -28,6 +28,34 @@ class TestLLMClient:
         assert openai_client.base_url == "https://api.openai.com/v1/"
         assert ollama_client.base_url == "http://localhost:11434/v1/"
 
+        # Clients are cached per provider
+        assert llm_client.get_client("openai") is openai_client
+        assert llm_client.get_client("ollama") is ollama_client
+
+    def test_get_client_follows_config_changes(self, llm_client):
+        # Setup
+        openai_client = llm_client.get_client("openai")
+
+        # Execute - a config reload changed the provider's endpoint
+        llm_client.config.providers["openai"]["base_url"] = "http://localhost:8080/v1"
+        new_client = llm_client.get_client("openai")
+
+        # Verify
+        assert new_client is not openai_client
+        assert new_client.base_url == "http://localhost:8080/v1/"
+
+    async def test_aclose(self, llm_client):
+        # Setup
+        openai_client = llm_client.get_client("openai")
+
+        # Execute
+        with patch.object(openai_client, "close", new_callable=AsyncMock) as mock_close:
+            await llm_client.aclose()
+
+        # Verify
+        mock_close.assert_called_once()
+        assert llm_client.get_client("openai") is not openai_client
+
     def test_model_supports_images(self, llm_client):
         # Setup & Execute & Verify
         # Models with vision capabilities
@@ -36,6 +64,7 @@ class TestLLMClient:
         assert llm_client.model_supports_images("gemini-pro") is True
         assert llm_client.model_supports_images("llava-13b") is True
         assert llm_client.model_supports_images("mistral-small-vision") is True
+        assert llm_client.model_supports_images("GPT-4o") is True  # Case-insensitive
 
         # Models without vision capabilities
         assert llm_client.model_supports_images("gpt-3.5-turbo") is False
@@ -75,6 +104,18 @@ class TestLLMClient:
             "Discord IDs" not in system_msg_mistral["content"]
         )  # Mistral doesn't support usernames
 
+    def test_prepare_system_message_tracks_date(self, llm_client):
+        # Setup
+        with patch("app.llm_client.date") as mock_date:
+            mock_date.today.return_value = date(2024, 1, 1)
+            first = llm_client.prepare_system_message("gpt-4o", "openai")
+            mock_date.today.return_value = date(2024, 1, 2)
+            second = llm_client.prepare_system_message("gpt-4o", "openai")
+
+        # Verify - the cached prompt is rebuilt once the day changes
+        assert "Today's date: January 01 2024." in first["content"]
+        assert "Today's date: January 02 2024." in second["content"]
+
     def test_prepare_system_message_empty(self, test_config, llm_client):
         # Setup
         test_config.system_prompt = ""
@@ -85,7 +126,6 @@ class TestLLMClient:
         # Verify
         assert system_msg == {}  # Should return empty dict when no system prompt is set
 
-    @pytest.mark.asyncio
     async def test_generate_response(self, llm_client):
         # Setup
         messages = [{"role": "user", "content": "Hello, bot!"}]
@@ -155,7 +195,6 @@ class TestLLMClient:
         assert call_kwargs["stream"] is True
         assert call_kwargs["extra_body"] == {"max_tokens": 2048, "temperature": 0.7}
 
-    @pytest.mark.asyncio
     async def test_generate_response_error(self, llm_client):
         # Setup
         messages = [{"role": "user", "content": "Hello, bot!"}]
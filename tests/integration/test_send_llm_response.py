@@ -1,16 +1,30 @@
+import asyncio
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import discord
 import pytest
 
 from app.models import ConversationWarnings
+from tests.fakes import FakeMessage
+
+
+def _eager_create_task(coro):
+    """Start the task eagerly so mocked edits finish before create_task returns."""
+    return asyncio.Task(coro, loop=asyncio.get_running_loop(), eager_start=True)
+
+
+@pytest.fixture(autouse=True)
+def _stub_create_task(monkeypatch, request):
+    """Run edit tasks inline unless a test opts out with no_stub_create_task."""
+    if "no_stub_create_task" in request.keywords:
+        return
+    monkeypatch.setattr("app.discord_client.create_task", _eager_create_task)
 
 
 class TestSendLLMResponse:
 
-    @pytest.mark.asyncio
     async def test_send_llm_response_plain_response(
-        self, discord_client, mock_discord_message
+        self, discord_client, mock_discord_message, locked_node, async_gen_factory
     ):
         # Setup
         messages = [{"role": "user", "content": "Hello"}]
@@ -19,33 +33,21 @@ class TestSendLLMResponse:
         max_message_length = 2000
 
         # Mock the LLM response using a real async generator
-        content_parts = ["This is a test response", " with multiple parts."]
-        finish_reasons = [None, "stop"]
-
-        # Create a proper async generator
-        async def mock_generate_response(messages):
-            for content, reason in zip(content_parts, finish_reasons):
-                yield content, reason
-
-        # Patch the method directly
-        discord_client.llm_client.generate_response = mock_generate_response
+        discord_client.llm_client.generate_response = async_gen_factory(
+            [("This is a test response", None), (" with multiple parts.", "stop")]
+        )
 
         # Mock message_store.get to return a MsgNode
-        node = MagicMock()
-        node.lock = AsyncMock()
-        node.lock.acquire = AsyncMock()
-        node.lock.release = AsyncMock()
-        discord_client.message_store.get.return_value = node
+        discord_client.message_store.get.return_value = locked_node
 
         # Execute
-        with patch("app.discord_client.asyncio.create_task"):
-            await discord_client.send_llm_response(
-                mock_discord_message,
-                messages,
-                warnings,
-                use_plain_responses,
-                max_message_length,
-            )
+        await discord_client.send_llm_response(
+            mock_discord_message,
+            messages,
+            warnings,
+            use_plain_responses,
+            max_message_length,
+        )
 
         # Verify
         mock_discord_message.reply.assert_called_once()
@@ -63,9 +65,8 @@ class TestSendLLMResponse:
             )
             assert call_args[1].get("suppress_embeds", False) is True
 
-    @pytest.mark.asyncio
     async def test_send_llm_response_with_embeds(
-        self, discord_client, mock_discord_message
+        self, discord_client, mock_discord_message, locked_node, async_gen_factory
     ):
         # Setup
         messages = [{"role": "user", "content": "Hello"}]
@@ -77,28 +78,17 @@ class TestSendLLMResponse:
         warnings.add("Test Warning")
 
         # Mock the LLM response using a real async generator
-        content_parts = ["This is a test response", " with multiple parts."]
-        finish_reasons = [None, "stop"]
-
-        # Create a proper async generator
-        async def mock_generate_response(messages):
-            for content, reason in zip(content_parts, finish_reasons):
-                yield content, reason
-
-        # Patch the method directly
-        discord_client.llm_client.generate_response = mock_generate_response
+        discord_client.llm_client.generate_response = async_gen_factory(
+            [("This is a test response", None), (" with multiple parts.", "stop")]
+        )
 
         # Mock reply to get the response message
-        response_msg = MagicMock(spec=discord.Message)
+        response_msg = FakeMessage(id=987654321)
         response_msg.edit = AsyncMock()
         mock_discord_message.reply.return_value = response_msg
 
         # Mock message_store.get to return a MsgNode
-        node = MagicMock()
-        node.lock = AsyncMock()
-        node.lock.acquire = AsyncMock()
-        node.lock.release = AsyncMock()
-        discord_client.message_store.get.return_value = node
+        discord_client.message_store.get.return_value = locked_node
 
         # Mock the embed creation
         mock_embed = MagicMock(spec=discord.Embed)
@@ -108,22 +98,17 @@ class TestSendLLMResponse:
 
         with patch("discord.Embed", return_value=mock_embed):
             with patch("app.utils.create_embed_for_warnings", return_value=mock_embed):
-                # Mock the asyncio task creation
-                with patch(
-                    "app.discord_client.asyncio.create_task",
-                    side_effect=lambda coro: coro,
-                ):
-                    # Set current_time for last_task_time check
-                    discord_client.last_task_time = 0
-
-                    # Execute
-                    await discord_client.send_llm_response(
-                        mock_discord_message,
-                        messages,
-                        warnings,
-                        use_plain_responses,
-                        max_message_length,
-                    )
+                # Set current_time for last_task_time check
+                discord_client.last_task_time = 0
+
+                # Execute
+                await discord_client.send_llm_response(
+                    mock_discord_message,
+                    messages,
+                    warnings,
+                    use_plain_responses,
+                    max_message_length,
+                )
 
         # Verify
         mock_discord_message.reply.assert_called_once()
@@ -136,11 +121,34 @@ class TestSendLLMResponse:
         discord_client.message_store.set.assert_called_once()
 
         # Verify the node.text was updated with the complete response text
-        assert node.text == "This is a test response with multiple parts."
+        assert locked_node.text == "This is a test response with multiple parts."
+
+    @pytest.mark.no_stub_create_task
+    async def test_send_llm_response_final_edit_runs_as_task(
+        self, discord_client, mock_discord_message, locked_node, async_gen_factory
+    ):
+        # Setup
+        discord_client.llm_client.generate_response = async_gen_factory(
+            [("Hello", None), (", world", None), ("!", "stop")]
+        )
+        response_msg = FakeMessage(id=987654321)
+        response_msg.edit = AsyncMock()
+        mock_discord_message.reply.return_value = response_msg
+        discord_client.message_store.get.return_value = locked_node
+
+        # Execute
+        await discord_client.send_llm_response(
+            mock_discord_message, [], ConversationWarnings(), False, 2000
+        )
+        await asyncio.sleep(0)  # Let the scheduled edit run
+
+        # Verify - the final edit went out through a real task
+        response_msg.edit.assert_awaited_once()
+        embed = response_msg.edit.call_args.kwargs["embed"]
+        assert embed.description == "Hello, world!"
 
-    @pytest.mark.asyncio
     async def test_send_llm_response_error_handling(
-        self, discord_client, mock_discord_message
+        self, discord_client, mock_discord_message, async_gen_factory
     ):
         # Setup
         messages = [{"role": "user", "content": "Hello"}]
@@ -149,11 +157,9 @@ class TestSendLLMResponse:
         max_message_length = 2000
 
         # Mock LLM to raise an exception during generation
-        async def mock_generate_error(messages):
-            raise Exception("Test error")
-            yield  # This won't be reached
-
-        discord_client.llm_client.generate_response = mock_generate_error
+        discord_client.llm_client.generate_response = async_gen_factory(
+            [], error=Exception("Test error")
+        )
 
         # Execute
         with patch("logging.exception") as mock_logging:
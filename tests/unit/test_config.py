@@ -1,11 +1,12 @@
 from unittest.mock import mock_open, patch
 
 import pytest
+import yaml
 
-from config.config import Config
+from config.config import Config, _load_yaml_cached, _SafeLoader
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def test_config_data():
     return {
         "bot_token": "test_token",
@@ -33,24 +34,63 @@ def test_config_data():
     }
 
 
-class TestConfig:
+@pytest.fixture(scope="session")
+def yaml_config_file(tmp_path_factory, test_config_data):
+    """Fixture that writes the test configuration to a real YAML file."""
+    path = tmp_path_factory.mktemp("cfg") / "config.yaml"
+    path.write_text(yaml.safe_dump(test_config_data))
+    return str(path)
 
-    @patch("builtins.open", new_callable=mock_open)
-    @patch("yaml.safe_load")
-    def test_init_and_reload(self, mock_yaml_load, mock_file, test_config_data):
-        # Setup
-        mock_yaml_load.return_value = test_config_data
 
-        # Execute
-        config = Config("test_config.yaml")
+@pytest.fixture(autouse=True)
+def clear_yaml_cache():
+    """Start every test with an empty parse cache."""
+    _load_yaml_cached.cache_clear()
+
+
+@pytest.fixture
+def mock_stat():
+    """Give the config file a fixed mtime."""
+    with patch("os.stat") as mock_stat:
+        mock_stat.return_value.st_mtime_ns = 1
+        yield mock_stat
+
+
+class TestConfigFile:
+
+    @pytest.mark.parametrize(
+        "loader",
+        [
+            yaml.SafeLoader,
+            pytest.param(
+                getattr(yaml, "CSafeLoader", None),
+                marks=pytest.mark.skipif(
+                    not hasattr(yaml, "CSafeLoader"), reason="LibYAML not available"
+                ),
+            ),
+        ],
+        ids=["python", "libyaml"],
+    )
+    def test_init_and_reload(self, yaml_config_file, test_config_data, loader):
+        # Setup
+        with patch("config.config._SafeLoader", loader):
+            # Execute
+            config = Config(yaml_config_file)
 
         # Verify
-        mock_file.assert_called_once_with("test_config.yaml", "r")
-        mock_yaml_load.assert_called_once()
         assert config.data == test_config_data
+        assert config.model == "openai/gpt-4o"
+
+    def test_default_loader(self):
+        # Verify - prefers the C parser whenever LibYAML is available
+        assert _SafeLoader is getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+@pytest.mark.usefixtures("mock_stat")
+class TestConfig:
 
     @patch("builtins.open", new_callable=mock_open)
-    @patch("yaml.safe_load")
+    @patch("yaml.load")
     def test_reload_error_handling(self, mock_yaml_load, mock_file):
         # Setup
         mock_yaml_load.side_effect = Exception("Test exception")
@@ -62,7 +102,7 @@ class TestConfig:
         assert config.data == {}
 
     @patch("builtins.open", new_callable=mock_open)
-    @patch("yaml.safe_load")
+    @patch("yaml.load")
     def test_get_method(self, mock_yaml_load, mock_file, test_config_data):
         # Setup
         mock_yaml_load.return_value = test_config_data
@@ -74,7 +114,7 @@ class TestConfig:
         assert config.get("nonexistent_key", "default") == "default"
 
     @patch("builtins.open", new_callable=mock_open)
-    @patch("yaml.safe_load")
+    @patch("yaml.load")
     def test_getitem_method(self, mock_yaml_load, mock_file, test_config_data):
         # Setup
         mock_yaml_load.return_value = test_config_data
@@ -88,7 +128,7 @@ class TestConfig:
             config["nonexistent_key"]
 
     @patch("builtins.open", new_callable=mock_open)
-    @patch("yaml.safe_load")
+    @patch("yaml.load")
     def test_properties(self, mock_yaml_load, mock_file, test_config_data):
         # Setup
         mock_yaml_load.return_value = test_config_data
@@ -103,14 +143,19 @@ class TestConfig:
         assert config.max_messages == 10
         assert config.use_plain_responses is False
         assert config.allow_dms is True
-        assert config.permissions == test_config_data["permissions"]
+        assert config.permissions == {
+            "users": {"allowed_ids": {111, 222}, "blocked_ids": {333}},
+            "roles": {"allowed_ids": {444, 555}, "blocked_ids": {666}},
+            "channels": {"allowed_ids": {777, 888}, "blocked_ids": {999}},
+        }
+        assert isinstance(config.permissions["users"]["allowed_ids"], frozenset)
         assert config.system_prompt == "Test system prompt"
         assert config.providers == test_config_data["providers"]
         assert config.model == "openai/gpt-4o"
         assert config.extra_api_parameters == test_config_data["extra_api_parameters"]
 
     @patch("builtins.open", new_callable=mock_open)
-    @patch("yaml.safe_load")
+    @patch("yaml.load")
     def test_constant_values(self, mock_yaml_load, mock_file, test_config_data):
         # Setup
         mock_yaml_load.return_value = test_config_data
@@ -122,6 +167,7 @@ class TestConfig:
         assert "openai" in config.PROVIDERS_SUPPORTING_USERNAMES
         assert "image" in config.ALLOWED_FILE_TYPES
         assert "text" in config.ALLOWED_FILE_TYPES
+        assert isinstance(config.VISION_MODEL_TAGS, frozenset)
         assert config.EMBED_COLOR_COMPLETE == 0x006400
         assert config.EMBED_COLOR_INCOMPLETE == 0xFFA500
         assert config.STREAMING_INDICATOR == " ⚪"
@@ -129,7 +175,7 @@ class TestConfig:
         assert config.MAX_MESSAGE_NODES == 100
 
     @patch("builtins.open", new_callable=mock_open)
-    @patch("yaml.safe_load")
+    @patch("yaml.load")
     def test_default_properties(self, mock_yaml_load, mock_file):
         # Setup - empty config
         mock_yaml_load.return_value = {}
@@ -145,11 +191,67 @@ class TestConfig:
         assert config.use_plain_responses is False
         assert config.allow_dms is True
         assert config.permissions == {
-            "users": {"allowed_ids": [], "blocked_ids": []},
-            "roles": {"allowed_ids": [], "blocked_ids": []},
-            "channels": {"allowed_ids": [], "blocked_ids": []},
+            "users": {"allowed_ids": frozenset(), "blocked_ids": frozenset()},
+            "roles": {"allowed_ids": frozenset(), "blocked_ids": frozenset()},
+            "channels": {"allowed_ids": frozenset(), "blocked_ids": frozenset()},
         }
         assert config.system_prompt == ""
         assert config.providers == {}
         assert config.model == ""
         assert config.extra_api_parameters == {}
+
+    @patch("builtins.open", new_callable=mock_open)
+    @patch("yaml.load")
+    def test_default_permissions_shared(self, mock_yaml_load, mock_file):
+        # Setup - empty config
+        mock_yaml_load.return_value = {}
+
+        # Execute
+        config1 = Config("test_config.yaml")
+        config2 = Config("other_config.yaml")
+
+        # Verify - both share one read-only default
+        assert config1.permissions is config2.permissions
+        with pytest.raises(TypeError):
+            config1.permissions["users"]["allowed_ids"] = frozenset({111})
+
+    @patch("builtins.open", new_callable=mock_open)
+    @patch("yaml.load")
+    def test_reload_skips_unchanged_file(
+        self, mock_yaml_load, mock_file, mock_stat, test_config_data
+    ):
+        # Setup
+        mock_yaml_load.return_value = test_config_data
+        config = Config("test_config.yaml")
+
+        # Execute - file unchanged
+        config.reload()
+        config.reload()
+
+        # Verify - parsed only once
+        mock_yaml_load.assert_called_once()
+
+        # Execute - file modified
+        mock_yaml_load.return_value = {**test_config_data, "model": "ollama/llama3"}
+        mock_stat.return_value.st_mtime_ns = 2
+        config.reload()
+
+        # Verify - re-parsed and picked up the change
+        assert mock_yaml_load.call_count == 2
+        assert config.model == "ollama/llama3"
+
+    @patch("builtins.open", new_callable=mock_open)
+    @patch("yaml.load")
+    def test_reload_error_keeps_last_config(
+        self, mock_yaml_load, mock_file, mock_stat, test_config_data
+    ):
+        # Setup
+        mock_yaml_load.return_value = test_config_data
+        config = Config("test_config.yaml")
+
+        # Execute - the file becomes unreadable
+        mock_stat.side_effect = FileNotFoundError("test_config.yaml")
+        config.reload()
+
+        # Verify
+        assert config.data == test_config_data
@@ -1,13 +1,19 @@
 import sqlite3
+import time
+from unittest.mock import patch
 
-from app.database import Database
+import aiosqlite
+import pytest
+
+from app.database import SCHEMA_VERSION, ConnectionPool, Database, create_pool
 
 
 class TestDatabase:
 
-    def test_init_creates_tables(self, temp_db_path):
+    async def test_connect_creates_tables(self, temp_db_path):
         # Setup & Execute
-        db = Database(temp_db_path)
+        db = Database(ConnectionPool(temp_db_path))
+        await db.connect()
 
         # Verify tables were created
         conn = sqlite3.connect(temp_db_path)
@@ -25,16 +31,109 @@ class TestDatabase:
         )
         assert cursor.fetchone() is not None
 
+        # Check indexes
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='index'")
+        indexes = {row[0] for row in cursor.fetchall()}
+        assert {"idx_conv_user_active", "idx_messages_conv"} <= indexes
+
         conn.close()
 
-    def test_create_conversation(self, db):
+        # Creating the schema again is a no-op
+        await db._create_tables()
+        await db.close()
+
+    async def test_connect_migrates_text_timestamps(self, temp_db_path):
+        # Setup - a database created before timestamps were stored as integers
+        conn = sqlite3.connect(temp_db_path)
+        conn.execute(
+            """
+            CREATE TABLE messages (
+                message_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                conversation_id INTEGER NOT NULL,
+                discord_message_id INTEGER,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                has_images BOOLEAN DEFAULT 0
+            )
+            """
+        )
+        conn.executemany(
+            "INSERT INTO messages (conversation_id, role, content, timestamp) "
+            "VALUES (1, 'user', ?, ?)",
+            [
+                ("Second", "2024-05-01T12:00:01.500000"),
+                ("First", "2024-05-01T12:00:00"),
+            ],
+        )
+        conn.commit()
+        conn.close()
+
+        # Execute
+        db = Database(ConnectionPool(temp_db_path))
+        await db.connect()
+
+        # Verify
+        conn = sqlite3.connect(temp_db_path)
+        rows = conn.execute(
+            "SELECT content, typeof(timestamp), timestamp FROM messages "
+            "ORDER BY timestamp"
+        ).fetchall()
+        user_version = conn.execute("PRAGMA user_version").fetchone()[0]
+        conn.close()
+
+        assert rows == [
+            ("First", "integer", 1714564800 * 10**9),
+            ("Second", "integer", 1714564801_500 * 10**6),
+        ]
+        assert user_version == SCHEMA_VERSION
+        messages = await db.get_conversation_messages(1)
+        assert [m["content"] for m in messages] == ["First", "Second"]
+
+        await db.close()
+
+    async def test_migration_converts_local_timestamps_to_utc(
+        self, temp_db_path, monkeypatch
+    ):
+        # Setup - a naive timestamp written by a host two hours ahead of UTC
+        conn = sqlite3.connect(temp_db_path)
+        conn.execute(
+            "CREATE TABLE messages (message_id INTEGER PRIMARY KEY, "
+            "conversation_id INTEGER NOT NULL, role TEXT NOT NULL, "
+            "content TEXT NOT NULL, timestamp TIMESTAMP)"
+        )
+        conn.execute(
+            "INSERT INTO messages (conversation_id, role, content, timestamp) "
+            "VALUES (1, 'user', 'Hello', '2024-05-01T12:00:00')"
+        )
+        conn.commit()
+        conn.close()
+
+        monkeypatch.setenv("TZ", "EET-2")
+        time.tzset()
+        try:
+            # Execute
+            db = Database(ConnectionPool(temp_db_path))
+            await db.connect()
+            await db.close()
+        finally:
+            monkeypatch.undo()
+            time.tzset()
+
+        # Verify - 12:00 local is 10:00 UTC
+        conn = sqlite3.connect(temp_db_path)
+        (timestamp,) = conn.execute("SELECT timestamp FROM messages").fetchone()
+        conn.close()
+        assert timestamp == 1714557600 * 10**9
+
+    async def test_create_conversation(self, db):
         # Setup
         user_id = 12345
         guild_id = 67890
         channel_id = 54321
 
         # Execute
-        conversation_id = db.create_conversation(user_id, guild_id, channel_id)
+        conversation_id = await db.create_conversation(user_id, guild_id, channel_id)
 
         # Verify
         assert conversation_id > 0
@@ -54,16 +153,16 @@ class TestDatabase:
         assert row[3] == channel_id  # channel_id
         assert row[6] == 1  # is_active
 
-    def test_add_message(self, db):
+    async def test_add_message(self, db):
         # Setup
-        conversation_id = db.create_conversation(12345, 67890, 54321)
+        conversation_id = await db.create_conversation(12345, 67890, 54321)
         role = "user"
         content = "Test message"
         discord_message_id = 98765
         has_images = False
 
         # Execute
-        result = db.add_message(
+        result = await db.add_message(
             conversation_id, role, content, discord_message_id, has_images
         )
 
@@ -84,17 +183,43 @@ class TestDatabase:
         assert row[2] == discord_message_id  # discord_message_id
         assert row[3] == role  # role
         assert row[4] == content  # content
+        assert isinstance(row[5], int)  # timestamp, in nanoseconds
         assert row[6] == has_images  # has_images
 
-    def test_get_active_conversation(self, db):
+    async def test_add_messages_bulk(self, db):
+        # Setup
+        conversation_id = await db.create_conversation(12345, 67890, 54321)
+        rows = [
+            ("user" if i % 2 == 0 else "assistant", f"Message {i}", 1000 + i, False)
+            for i in range(10)
+        ]
+
+        commits = []
+        real_commit = aiosqlite.Connection.commit
+
+        async def counting_commit(conn):
+            commits.append(conn)
+            await real_commit(conn)
+
+        # Execute
+        with patch.object(aiosqlite.Connection, "commit", counting_commit):
+            result = await db.add_messages(conversation_id, rows)
+
+        # Verify - all rows written in insertion order with a single commit
+        assert result is True
+        assert len(commits) == 1
+        messages = await db.get_conversation_messages(conversation_id, limit=25)
+        assert [m["content"] for m in messages] == [f"Message {i}" for i in range(10)]
+
+    async def test_get_active_conversation(self, db):
         # Setup
         user_id = 12345
-        conversation_id1 = db.create_conversation(user_id, 67890, 54321)
+        conversation_id1 = await db.create_conversation(user_id, 67890, 54321)
         # Create a second conversation for the same user (should mark the first as inactive)
-        conversation_id2 = db.create_conversation(user_id, 67890, 54321)
+        conversation_id2 = await db.create_conversation(user_id, 67890, 54321)
 
         # Execute
-        active_conversation_id = db.get_active_conversation(user_id)
+        active_conversation_id = await db.get_active_conversation(user_id)
 
         # Verify
         assert active_conversation_id == conversation_id2
@@ -111,17 +236,17 @@ class TestDatabase:
 
         assert is_active == 0
 
-    def test_get_conversation_messages(self, db):
+    async def test_get_conversation_messages(self, db):
         # Setup
-        conversation_id = db.create_conversation(12345, 67890, 54321)
+        conversation_id = await db.create_conversation(12345, 67890, 54321)
 
         # Add multiple messages
-        db.add_message(conversation_id, "user", "Message 1")
-        db.add_message(conversation_id, "assistant", "Message 2")
-        db.add_message(conversation_id, "user", "Message 3")
+        await db.add_message(conversation_id, "user", "Message 1")
+        await db.add_message(conversation_id, "assistant", "Message 2")
+        await db.add_message(conversation_id, "user", "Message 3")
 
         # Execute
-        messages = db.get_conversation_messages(conversation_id)
+        messages = await db.get_conversation_messages(conversation_id)
 
         # Verify
         assert len(messages) == 3
@@ -132,13 +257,60 @@ class TestDatabase:
         assert messages[2]["role"] == "user"
         assert messages[2]["content"] == "Message 3"
 
-    def test_reset_user_history(self, db):
+    async def test_get_conversation_messages_cached(self, db):
+        # Setup
+        conversation_id = await db.create_conversation(12345, 67890, 54321)
+        await db.add_message(conversation_id, "user", "Message 1")
+        first = await db.get_conversation_messages(conversation_id)
+
+        # Write behind the cache's back
+        conn = sqlite3.connect(db.db_path)
+        conn.execute(
+            "INSERT INTO messages (conversation_id, role, content) VALUES (?, ?, ?)",
+            (conversation_id, "user", "Untracked"),
+        )
+        conn.commit()
+        conn.close()
+
+        # Execute & Verify - served from the cache
+        assert await db.get_conversation_messages(conversation_id) == first
+
+        # Execute & Verify - adding a message invalidates the cached result
+        await db.add_message(conversation_id, "assistant", "Message 2")
+        messages = await db.get_conversation_messages(conversation_id)
+        assert {m["content"] for m in messages} == {
+            "Message 1",
+            "Untracked",
+            "Message 2",
+        }
+
+    async def test_get_conversation_messages_does_not_track_reads(self, db):
+        # Execute - look up a conversation that was never written
+        await db.get_conversation_messages(999)
+
+        # Verify - only writes add version entries
+        assert 999 not in db._versions
+
+    async def test_get_conversation_messages_returns_rows(self, db):
+        # Setup
+        conversation_id = await db.create_conversation(12345, 67890, 54321)
+        await db.add_message(conversation_id, "user", "Message 1")
+
+        # Execute
+        messages = await db.get_conversation_messages(conversation_id)
+
+        # Verify - rows support both name and index access
+        assert isinstance(messages[0], sqlite3.Row)
+        assert messages[0]["role"] == messages[0][0] == "user"
+        assert messages[0]["content"] == messages[0][1] == "Message 1"
+
+    async def test_reset_user_history(self, db):
         # Setup
         user_id = 12345
-        conversation_id = db.create_conversation(user_id, 67890, 54321)
+        conversation_id = await db.create_conversation(user_id, 67890, 54321)
 
         # Execute
-        result = db.reset_user_history(user_id)
+        result = await db.reset_user_history(user_id)
 
         # Verify
         assert result is True
@@ -154,40 +326,150 @@ class TestDatabase:
 
         assert is_active == 0
 
-    def test_get_user_stats(self, db):
+    async def test_get_user_stats(self, db):
         # Setup
         user_id = 12345
-        conversation_id = db.create_conversation(user_id, 67890, 54321)
+        conversation_id = await db.create_conversation(user_id, 67890, 54321)
 
         # Add multiple messages
-        db.add_message(conversation_id, "user", "Message 1")
-        db.add_message(conversation_id, "assistant", "Message 2")
-        db.add_message(conversation_id, "user", "Message 3")
+        await db.add_message(conversation_id, "user", "Message 1")
+        await db.add_message(conversation_id, "assistant", "Message 2")
+        await db.add_message(conversation_id, "user", "Message 3")
 
         # Execute
-        stats = db.get_user_stats(user_id)
+        stats = await db.get_user_stats(user_id)
 
         # Verify
         assert stats["total_messages"] == 3
         assert stats["total_conversations"] == 1
         assert stats["first_conversation"] is not None
 
-    def test_conversation_limit(self, db):
+    async def test_conversation_limit(self, db):
         # Test that the get_conversation_messages respects the limit parameter
 
         # Setup
-        conversation_id = db.create_conversation(12345, 67890, 54321)
+        conversation_id = await db.create_conversation(12345, 67890, 54321)
 
         # Add 10 messages
         for i in range(10):
-            db.add_message(
+            await db.add_message(
                 conversation_id, "user" if i % 2 == 0 else "assistant", f"Message {i}"
             )
 
         # Execute with limit=5
-        messages = db.get_conversation_messages(conversation_id, limit=5)
+        messages = await db.get_conversation_messages(conversation_id, limit=5)
 
         # Verify
         assert len(messages) == 5
         for i in range(5):
             assert messages[i]["content"] == f"Message {i}"
+
+    async def test_queries_use_indexes(self, db):
+        # Setup
+        conn = sqlite3.connect(db.db_path)
+        cursor = conn.cursor()
+
+        # Execute
+        cursor.execute(
+            """
+            EXPLAIN QUERY PLAN
+            SELECT conversation_id FROM conversations
+            WHERE user_id = ? AND is_active = 1
+            ORDER BY updated_at DESC
+            LIMIT 1
+            """,
+            (12345,),
+        )
+        conversation_plan = " ".join(row[3] for row in cursor.fetchall())
+        cursor.execute(
+            """
+            EXPLAIN QUERY PLAN
+            SELECT role, content
+            FROM messages
+            WHERE conversation_id = ?
+            ORDER BY timestamp ASC, message_id ASC
+            LIMIT ?
+            """,
+            (1, 25),
+        )
+        messages_plan = " ".join(row[3] for row in cursor.fetchall())
+        conn.close()
+
+        # Verify
+        assert (
+            "SEARCH conversations USING INDEX idx_conv_user_active" in conversation_plan
+        )
+        assert "SEARCH messages USING INDEX idx_messages_conv" in messages_plan
+
+    async def test_bulk_load(self, db):
+        # Setup
+        conversation_ids = [
+            await db.create_conversation(user_id, 67890, 54321) for user_id in (1, 2)
+        ]
+        messages_by_conversation = {
+            conversation_id: [
+                ("user", f"Message {i}", None, False) for i in range(5_000)
+            ]
+            for conversation_id in conversation_ids
+        }
+        # Prime the history cache so the load has to invalidate it
+        await db.get_conversation_messages(conversation_ids[0], limit=3)
+
+        # Execute
+        start = time.perf_counter()
+        result = await db.bulk_load(messages_by_conversation)
+        elapsed = time.perf_counter() - start
+
+        # Verify
+        assert result is True
+        assert elapsed < 5
+        messages = await db.get_conversation_messages(conversation_ids[0], limit=3)
+        assert [m["content"] for m in messages] == [f"Message {i}" for i in range(3)]
+
+        # The index is rebuilt and the normal sync setting restored
+        async with db.pool.acquire() as conn:
+            cursor = await conn.execute(
+                "SELECT COUNT(*) FROM messages WHERE conversation_id = ?",
+                (conversation_ids[1],),
+            )
+            assert (await cursor.fetchone())[0] == 5_000
+            cursor = await conn.execute(
+                "SELECT name FROM sqlite_master WHERE name = 'idx_messages_conv'"
+            )
+            assert await cursor.fetchone() is not None
+            cursor = await conn.execute("PRAGMA synchronous")
+            assert (await cursor.fetchone())[0] == 1
+
+    async def test_pool_reuses_connections(self, temp_db_path):
+        # Setup
+        pool = await create_pool(temp_db_path, min_size=1, max_size=2)
+
+        # Execute
+        async with pool.acquire() as conn1:
+            pass
+        async with pool.acquire() as conn2:
+            pass
+
+        # Verify - the idle connection is handed out again
+        assert conn1 is conn2
+
+        await pool.close()
+
+    async def test_pool_connections_use_wal(self, temp_db_path):
+        # Setup
+        pool = await create_pool(temp_db_path)
+
+        # Execute
+        async with pool.acquire() as conn:
+            journal_mode = (
+                await (await conn.execute("PRAGMA journal_mode")).fetchone()
+            )[0]
+            synchronous = (await (await conn.execute("PRAGMA synchronous")).fetchone())[
+                0
+            ]
+
+        # Verify - WAL with synchronous=NORMAL (1)
+        assert journal_mode == "wal"
+        assert synchronous == 1
+
+        await pool.close()
@@ -1,7 +1,6 @@
+from collections import OrderedDict
 from unittest.mock import MagicMock
 
-import pytest
-
 from app.message_store import MessageStore
 from app.models import ConversationWarnings, MsgNode
 
@@ -53,6 +52,22 @@ class TestMessageStore:
         assert msg_id in message_store.nodes
         assert message_store.nodes[msg_id] is node
 
+    def test_get_evicts_least_recently_used(self, test_config):
+        # Setup
+        test_config.MAX_MESSAGE_NODES = 3
+        store = MessageStore(test_config)
+        for i in range(3):
+            store.get(i)
+
+        # Touch the oldest node so it becomes the most recently used
+        store.get(0)
+
+        # Execute
+        store.get(3)
+
+        # Verify - node 1 was the least recently used
+        assert list(store.nodes) == [2, 0, 3]
+
     def test_cleanup_removes_oldest_nodes(self, test_config):
         # Setup
         # Set MAX_MESSAGE_NODES to a smaller value for testing
@@ -75,7 +90,49 @@ class TestMessageStore:
         for i in range(5):
             assert i not in store.nodes
 
-    @pytest.mark.asyncio
+    async def test_cleanup_bulk_eviction(self, test_config):
+        # Setup
+        test_config.MAX_MESSAGE_NODES = 3
+        store = MessageStore(test_config)
+        for i in range(10):
+            store.nodes[i] = MsgNode()
+        await store.nodes[1].lock.acquire()
+
+        # Execute - most of the store is evicted at once
+        store.cleanup()
+
+        # Verify - recency order and locked nodes are preserved
+        assert isinstance(store.nodes, OrderedDict)
+        assert list(store.nodes) == [1, 8, 9]
+
+    async def test_cleanup_keeps_locked_nodes(self, test_config):
+        # Setup
+        test_config.MAX_MESSAGE_NODES = 2
+        store = MessageStore(test_config)
+        for i in range(4):
+            store.nodes[i] = MsgNode()
+        await store.nodes[0].lock.acquire()
+
+        # Execute
+        store.cleanup()
+
+        # Verify - the locked oldest node survives, the next oldest go instead
+        assert list(store.nodes) == [0, 3]
+
+    async def test_get_keeps_new_node_when_older_nodes_locked(self, test_config):
+        # Setup - the store is full and every node in it is locked
+        test_config.MAX_MESSAGE_NODES = 2
+        store = MessageStore(test_config)
+        for i in range(2):
+            await store.get(i).lock.acquire()
+
+        # Execute
+        node = store.get(2)
+
+        # Verify - the new node stays in the store, so later lookups reuse it
+        assert store.nodes[2] is node
+        assert store.get(2) is node
+
     async def test_build_conversation_chain(self, message_store, mock_discord_message):
         # This test will be incomplete since build_conversation_chain depends on discord_client.py
         # which needs more complex mocking. This is a placeholder implementation.
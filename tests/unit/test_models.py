@@ -48,7 +48,6 @@ class TestMsgNode:
         assert node.parent_msg is mock_parent
         assert isinstance(node.lock, asyncio.Lock)
 
-    @pytest.mark.asyncio
     async def test_lock(self):
         # Setup
         node = MsgNode()
@@ -65,6 +64,74 @@ class TestMsgNode:
         # Lock should be released automatically
         assert not node.lock.locked()
 
+    def test_slots(self):
+        # Setup & Execute
+        node = MsgNode()
+
+        # Verify - no per-instance __dict__, unknown attributes are rejected
+        assert not hasattr(node, "__dict__")
+        with pytest.raises(AttributeError):
+            node.unknown = True
+
+    async def test_lock_created_lazily(self):
+        # Setup
+        node = MsgNode()
+
+        # Execute & Verify - checking the state doesn't allocate a lock
+        assert node.is_locked() is False
+        assert node._lock is None
+
+        async with node.lock:
+            assert node.is_locked() is True
+        assert node.lock is node._lock
+
+    def test_lock_not_an_init_parameter(self):
+        # Execute & Verify - callers can't inject a lock
+        with pytest.raises(TypeError):
+            MsgNode(_lock=asyncio.Lock())
+
+    @pytest.mark.parametrize(
+        "text, images, include_name, expected",
+        [
+            ("Hello world", [], False, {"content": "Hello", "role": "user"}),
+            (
+                "Hello",
+                [{"type": "image_url"}] * 3,
+                True,
+                {
+                    "content": [
+                        {"type": "text", "text": "Hello"},
+                        {"type": "image_url"},
+                        {"type": "image_url"},
+                    ],
+                    "role": "user",
+                    "name": "12345",
+                },
+            ),
+            (
+                None,
+                [{"type": "image_url"}],
+                False,
+                {
+                    "content": [{"type": "image_url"}],
+                    "role": "user",
+                },
+            ),
+            (None, [], False, None),
+        ],
+    )
+    def test_to_api_message(self, text, images, include_name, expected):
+        # Setup
+        node = MsgNode(text=text, images=images, role="user", user_id=12345)
+
+        # Execute
+        message = node.to_api_message(
+            max_text=5, max_images=2, include_name=include_name
+        )
+
+        # Verify
+        assert message == expected
+
 
 class TestConversationWarnings:
 
@@ -102,3 +169,18 @@ class TestConversationWarnings:
 
         # Verify
         assert sorted_warnings == ["A - Warning", "B - Warning", "C - Warning"]
+
+    def test_get_sorted_returns_copy(self):
+        # Setup
+        warnings = ConversationWarnings()
+        warnings.add("B - Warning")
+        first = warnings.get_sorted()
+
+        # Execute
+        first.append("Z - Warning")
+        warnings.add("A - Warning")
+        warnings.add("B - Warning")
+
+        # Verify - callers can't mutate the stored order, and duplicates stay out
+        assert first == ["B - Warning", "Z - Warning"]
+        assert warnings.get_sorted() == ["A - Warning", "B - Warning"]
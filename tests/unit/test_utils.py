@@ -1,3 +1,6 @@
+import asyncio
+from contextlib import aclosing
+from types import SimpleNamespace
 from unittest.mock import AsyncMock, MagicMock
 
 import discord
@@ -5,577 +8,527 @@ import httpx
 import pytest
 
 from app.models import ConversationWarnings, MsgNode
-from app.utils import (check_permissions, create_embed_for_warnings,
-                       extract_message_content, find_parent_message,
-                       truncate_messages)
-
-
-class TestExtractMessageContent:
-
-    @pytest.mark.asyncio
-    async def test_extract_text_only(
-        self, mock_discord_message, mock_client, test_config
-    ):
-        # Setup
-        mock_discord_message.content = "Hello, bot!"
-        mock_discord_message.attachments = []
-        mock_node = MsgNode()
-
-        # Execute
-        text, images, has_bad_attachments = await extract_message_content(
-            mock_discord_message, mock_node, mock_client, test_config
-        )
-
-        # Verify
-        assert text == "Hello, bot!"
-        assert images == []
-        assert has_bad_attachments is False
-
-    @pytest.mark.asyncio
-    async def test_extract_with_bot_mention(
-        self, mock_discord_message, mock_client, test_config
-    ):
-        # Setup
-        bot_id = 999
-        mock_discord_message.content = f"<@{bot_id}> Hello!"
-        mock_discord_message.guild.me.id = bot_id
-        mock_discord_message.mentions = [MagicMock(spec=discord.Member)]
-        mock_discord_message.mentions[0].id = bot_id
-        mock_node = MsgNode()
-
-        # Execute
-        text, images, has_bad_attachments = await extract_message_content(
-            mock_discord_message, mock_node, mock_client, test_config
-        )
-
-        # Verify
-        assert text == "Hello!"
-        assert images == []
-        assert has_bad_attachments is False
-
-    @pytest.mark.asyncio
-    async def test_extract_with_embeds(
-        self, mock_discord_message, mock_client, test_config
-    ):
-        # Setup
-        mock_embed = MagicMock(spec=discord.Embed)
-        mock_embed.description = "Embed description"
-        mock_discord_message.content = "Message content"
-        mock_discord_message.embeds = [mock_embed]
-        mock_node = MsgNode()
-
-        # Execute
-        text, images, has_bad_attachments = await extract_message_content(
-            mock_discord_message, mock_node, mock_client, test_config
-        )
-
-        # Verify
-        assert "Message content" in text
-        assert "Embed description" in text
-        assert images == []
-        assert has_bad_attachments is False
-
-    @pytest.mark.asyncio
-    async def test_extract_with_text_attachment(
-        self, mock_discord_message, mock_client, test_config
-    ):
-        # Setup
-        mock_attachment = MagicMock(spec=discord.Attachment)
-        mock_attachment.content_type = "text/plain"
-        mock_attachment.url = "http://example.com/file.txt"
-        mock_discord_message.attachments = [mock_attachment]
-
-        mock_response = MagicMock(spec=httpx.Response)
-        mock_response.status_code = 200
-        mock_response.text = "Text file content"
-        mock_client.get.return_value = mock_response
-
-        mock_node = MsgNode()
-
-        # Execute
-        text, images, has_bad_attachments = await extract_message_content(
-            mock_discord_message, mock_node, mock_client, test_config
-        )
-
-        # Verify
-        assert "Hello, bot!" in text  # The original content
-        assert "Text file content" in text  # The attached file content
-        assert images == []
-        assert has_bad_attachments is False
-        mock_client.get.assert_called_once_with(mock_attachment.url)
-
-    @pytest.mark.asyncio
-    async def test_extract_with_image_attachment(
-        self, mock_discord_message, mock_client, test_config
-    ):
-        # Setup
-        mock_attachment = MagicMock(spec=discord.Attachment)
-        mock_attachment.content_type = "image/jpeg"
-        mock_attachment.url = "http://example.com/image.jpg"
-        mock_discord_message.attachments = [mock_attachment]
-
-        mock_response = MagicMock(spec=httpx.Response)
-        mock_response.status_code = 200
-        mock_response.content = b"fake_image_data"
-        mock_client.get.return_value = mock_response
-
-        mock_node = MsgNode()
-
-        # Execute
-        text, images, has_bad_attachments = await extract_message_content(
-            mock_discord_message, mock_node, mock_client, test_config
-        )
-
-        # Verify
-        assert text == "Hello, bot!"  # The original content
-        assert len(images) == 1
-        assert images[0]["type"] == "image_url"
-        assert "data:image/jpeg;base64," in images[0]["image_url"]["url"]
-        assert has_bad_attachments is False
-        mock_client.get.assert_called_once_with(mock_attachment.url)
-
-    @pytest.mark.asyncio
-    async def test_extract_with_unsupported_attachment(
-        self, mock_discord_message, mock_client, test_config
-    ):
-        # Setup
-        mock_attachment = MagicMock(spec=discord.Attachment)
-        mock_attachment.content_type = "application/pdf"  # Unsupported type
-        mock_attachment.url = "http://example.com/doc.pdf"
-        mock_discord_message.attachments = [mock_attachment]
-
-        mock_node = MsgNode()
-
-        # Execute
-        text, images, has_bad_attachments = await extract_message_content(
-            mock_discord_message, mock_node, mock_client, test_config
-        )
-
-        # Verify
-        assert text == "Hello, bot!"
-        assert images == []
-        assert has_bad_attachments is True
-        mock_client.get.assert_not_called()
-
-    @pytest.mark.asyncio
-    async def test_extract_with_failed_attachment_fetch(
-        self, mock_discord_message, mock_client, test_config
-    ):
-        # Setup
-        mock_attachment = MagicMock(spec=discord.Attachment)
-        mock_attachment.content_type = "image/jpeg"
-        mock_attachment.url = "http://example.com/image.jpg"
-        mock_discord_message.attachments = [mock_attachment]
-
-        # Mock client to raise an exception
-        mock_client.get.side_effect = Exception("Connection error")
-
-        mock_node = MsgNode()
-
-        # Execute
-        text, images, has_bad_attachments = await extract_message_content(
-            mock_discord_message, mock_node, mock_client, test_config
-        )
-
-        # Verify
-        assert text == "Hello, bot!"
-        assert images == []
-        assert has_bad_attachments is False  # Not marked as bad, just failed to fetch
-        mock_client.get.assert_called_once_with(mock_attachment.url)
-
-
-class TestFindParentMessage:
-
-    @pytest.mark.asyncio
-    async def test_find_parent_direct_reply(self):
-        # Setup - Direct reply
-        mock_msg = MagicMock(spec=discord.Message)
-        mock_parent = MagicMock(spec=discord.Message)
-
-        mock_msg.reference = MagicMock()
-        mock_msg.reference.message_id = 12345
-        mock_msg.reference.cached_message = mock_parent
-
-        # Execute
-        result = await find_parent_message(mock_msg)
-
-        # Verify
-        assert result is mock_parent
-
-    @pytest.mark.asyncio
-    async def test_find_parent_direct_reply_fetch(self):
-        # Setup - Direct reply, but not cached
-        mock_msg = MagicMock(spec=discord.Message)
-        mock_parent = MagicMock(spec=discord.Message)
-
-        mock_msg.reference = MagicMock()
-        mock_msg.reference.message_id = 12345
-        mock_msg.reference.cached_message = None
-
-        mock_msg.channel.fetch_message = AsyncMock(return_value=mock_parent)
-
-        # Execute
-        result = await find_parent_message(mock_msg)
-
-        # Verify
-        assert result is mock_parent
-        mock_msg.channel.fetch_message.assert_called_once_with(12345)
-
-    @pytest.mark.asyncio
-    async def test_find_parent_thread_starter(self):
-        # Setup - Thread starter message
-        mock_msg = MagicMock(spec=discord.Message)
-        mock_parent = MagicMock(spec=discord.Message)
-
-        mock_msg.reference = None
-        mock_msg.channel.type = discord.ChannelType.public_thread
-        mock_msg.channel.starter_message = mock_parent
-
-        # Execute
-        result = await find_parent_message(mock_msg)
-
-        # Verify
-        assert result is mock_parent
-
-    @pytest.mark.asyncio
-    async def test_find_parent_thread_starter_fetch(self):
-        # Setup - Thread starter message, but need to fetch
-        mock_msg = MagicMock(spec=discord.Message)
-        mock_parent = MagicMock(spec=discord.Message)
-
-        mock_msg.reference = None
-        mock_msg.channel.type = discord.ChannelType.public_thread
-        mock_msg.channel.starter_message = None
-        mock_msg.channel.id = 12345
-        mock_msg.channel.parent.fetch_message = AsyncMock(return_value=mock_parent)
-
-        # Execute
-        result = await find_parent_message(mock_msg)
-
-        # Verify
-        assert result is mock_parent
-        mock_msg.channel.parent.fetch_message.assert_called_once_with(12345)
+from app.utils import (buffer_stream, check_permissions,
+                       create_embed_for_warnings, extract_message_content,
+                       find_parent_message, truncate_messages)
+from tests.fakes import async_iter
+
+try:
+    from pybase64 import b64decode
+except ImportError:
+    from base64 import b64decode
+
+# Long message bodies for the truncate_messages cases, built once per session
+_A1500 = "a" * 1500
+_A1000 = "a" * 1000
+_A900 = "a" * 900
+_A500 = "a" * 500
+_B300 = "b" * 300
+
+# A realistically sized image body, so the encoder isn't only fed a few bytes
+_IMG_PAYLOAD = bytes(16_384)
+
+# Fetch failures, built once and shared by every case that raises them
+_CONN_ERR = Exception("Connection error")
+_HTTPX_CONNECT_ERR = httpx.ConnectError("Connection refused")
+_HTTPX_TIMEOUT = httpx.ReadTimeout("Timed out")
+
+_DATA_URL_PREFIXES = {
+    content_type: f"data:{content_type};base64,"
+    for content_type in ("image/jpeg", "image/png", "image/gif", "image/webp")
+}
+
+
+@pytest.mark.parametrize(
+    "content, mention_bot, embed_descriptions, attachment_types, "
+    "expected_text, expected_bad",
+    [
+        ("Hello, bot!", False, [], [], "Hello, bot!", False),
+        ("<@999> Hello!", True, [], [], "Hello!", False),
+        (
+            "Message content",
+            False,
+            ["Embed description"],
+            [],
+            "Message content\nEmbed description",
+            False,
+        ),
+        ("Hello, bot!", False, [], ["application/pdf"], "Hello, bot!", True),
+    ],
+    ids=["text_only", "bot_mention", "embeds", "unsupported_attachment"],
+)
+async def test_extract_variants(
+    mock_discord_message,
+    mock_client,
+    test_config,
+    mock_attachment_factory,
+    mock_embed_factory,
+    content,
+    mention_bot,
+    embed_descriptions,
+    attachment_types,
+    expected_text,
+    expected_bad,
+):
+    # Setup
+    mock_discord_message.content = content
+    if mention_bot:
+        mock_discord_message.mentions = [mock_discord_message.guild.me]
+    mock_discord_message.embeds = [
+        mock_embed_factory(description=description)
+        for description in embed_descriptions
+    ]
+    mock_discord_message.attachments = [
+        mock_attachment_factory(content_type=content_type, url="http://example.com")
+        for content_type in attachment_types
+    ]
+    mock_node = MsgNode()
+
+    # Execute
+    text, images, has_bad_attachments = await extract_message_content(
+        mock_discord_message, mock_node, mock_client, test_config
+    )
+
+    # Verify
+    assert text == expected_text
+    assert images == []
+    assert has_bad_attachments is expected_bad
+    # Unsupported attachments are never fetched
+    mock_client.get.assert_not_called()
+
+
+async def test_extract_with_text_attachment(
+    mock_discord_message,
+    mock_client,
+    mock_response,
+    test_config,
+    mock_attachment_factory,
+):
+    # Setup
+    mock_attachment = mock_attachment_factory(
+        content_type="text/plain", url="http://example.com/file.txt"
+    )
+    mock_discord_message.attachments = [mock_attachment]
+
+    mock_response.text = "Text file content"
+    mock_client.get.return_value = mock_response
+
+    mock_node = MsgNode()
+
+    # Execute
+    text, images, has_bad_attachments = await extract_message_content(
+        mock_discord_message, mock_node, mock_client, test_config
+    )
+
+    # Verify
+    assert "Hello, bot!" in text  # The original content
+    assert "Text file content" in text  # The attached file content
+    assert images == []
+    assert has_bad_attachments is False
+    mock_client.get.assert_called_once_with(mock_attachment.url)
+
+
+@pytest.mark.parametrize("content_type", list(_DATA_URL_PREFIXES))
+async def test_extract_with_image_attachment(
+    mock_discord_message,
+    mock_client,
+    mock_response,
+    test_config,
+    mock_attachment_factory,
+    content_type,
+):
+    # Setup
+    mock_attachment = mock_attachment_factory(
+        content_type=content_type, url="http://example.com/image"
+    )
+    mock_discord_message.attachments = [mock_attachment]
+
+    mock_response.content = _IMG_PAYLOAD
+    mock_client.get.return_value = mock_response
+
+    mock_node = MsgNode()
+
+    # Execute
+    text, images, has_bad_attachments = await extract_message_content(
+        mock_discord_message, mock_node, mock_client, test_config
+    )
+
+    # Verify
+    assert text == "Hello, bot!"  # The original content
+    assert len(images) == 1
+    assert images[0]["type"] == "image_url"
+    url = images[0]["image_url"]["url"]
+    assert url.startswith(_DATA_URL_PREFIXES[content_type])
+    encoded = url.split(",", 1)[1]
+    assert b64decode(encoded, validate=True) == _IMG_PAYLOAD
+    assert has_bad_attachments is False
+    mock_client.get.assert_called_once_with(mock_attachment.url)
+
+
+@pytest.mark.parametrize(
+    "error",
+    [_CONN_ERR, _HTTPX_CONNECT_ERR, _HTTPX_TIMEOUT],
+    ids=["exception", "connect_error", "timeout"],
+)
+async def test_extract_with_failed_attachment_fetch(
+    mock_discord_message, mock_client, test_config, mock_attachment_factory, error
+):
+    # Setup
+    mock_attachment = mock_attachment_factory(
+        content_type="image/jpeg", url="http://example.com/image.jpg"
+    )
+    mock_discord_message.attachments = [mock_attachment]
+
+    # Mock client to raise an exception
+    mock_client.get.side_effect = error
+
+    mock_node = MsgNode()
+
+    # Execute
+    text, images, has_bad_attachments = await extract_message_content(
+        mock_discord_message, mock_node, mock_client, test_config
+    )
+
+    # Verify
+    assert text == "Hello, bot!"
+    assert images == []
+    assert has_bad_attachments is False  # Not marked as bad, just failed to fetch
+    mock_client.get.assert_called_once_with(mock_attachment.url)
+
+
+async def test_find_parent_direct_reply(mock_message_factory):
+    # Setup - Direct reply
+    mock_msg = mock_message_factory()
+    mock_parent = mock_message_factory()
+
+    mock_msg.reference = MagicMock()
+    mock_msg.reference.message_id = 12345
+    mock_msg.reference.cached_message = mock_parent
 
-    @pytest.mark.asyncio
-    async def test_find_parent_dm_previous_message(self):
-        # Setup - DM channel, previous message from bot
-        mock_msg = MagicMock(spec=discord.Message)
-        mock_prev_msg = MagicMock(spec=discord.Message)
+    # Execute
+    result = await find_parent_message(mock_msg)
 
-        mock_msg.reference = None
-        mock_msg.channel.type = discord.ChannelType.private
-        mock_msg.author.bot = False
+    # Verify
+    assert result is mock_parent
 
-        mock_prev_msg.author.bot = True
-        mock_prev_msg.type = discord.MessageType.default
 
-        # Mock channel history to return the previous message
-        mock_msg.channel.history.return_value.__aiter__.return_value = [mock_prev_msg]
+async def test_find_parent_direct_reply_fetch(mock_message_factory):
+    # Setup - Direct reply, but not cached
+    mock_msg = mock_message_factory()
+    mock_parent = mock_message_factory()
 
-        # Execute
-        result = await find_parent_message(mock_msg)
+    mock_msg.reference = MagicMock()
+    mock_msg.reference.message_id = 12345
+    mock_msg.reference.cached_message = None
 
-        # Verify
-        assert result is mock_prev_msg
+    mock_msg.channel.fetch_message = AsyncMock(return_value=mock_parent)
 
-    @pytest.mark.asyncio
-    async def test_find_parent_same_author_previous_message(self):
-        # Setup - Regular channel, previous message from same author
-        mock_msg = MagicMock(spec=discord.Message)
-        mock_prev_msg = MagicMock(spec=discord.Message)
+    # Execute
+    result = await find_parent_message(mock_msg)
 
-        mock_msg.reference = None
-        mock_msg.channel.type = discord.ChannelType.text
-        mock_msg.guild.me = MagicMock()
-        mock_msg.content = "Hello"  # No bot mention
+    # Verify
+    assert result is mock_parent
+    mock_msg.channel.fetch_message.assert_called_once_with(12345)
 
-        mock_prev_msg.author = mock_msg.author  # Same author
-        mock_prev_msg.type = discord.MessageType.default
 
-        # Mock channel history to return the previous message
-        mock_msg.channel.history.return_value.__aiter__.return_value = [mock_prev_msg]
+async def test_find_parent_thread_starter(mock_message_factory):
+    # Setup - Thread starter message
+    mock_msg = mock_message_factory()
+    mock_parent = mock_message_factory()
 
-        # Execute
-        result = await find_parent_message(mock_msg)
+    mock_msg.reference = None
+    mock_msg.channel.type = discord.ChannelType.public_thread
+    mock_msg.channel.starter_message = mock_parent
 
-        # Verify
-        assert result is mock_prev_msg
+    # Execute
+    result = await find_parent_message(mock_msg)
 
-    @pytest.mark.asyncio
-    async def test_find_parent_with_bot_mention(self):
-        # Setup - Message with bot mention should start a new conversation
-        mock_msg = MagicMock(spec=discord.Message)
-        mock_msg.reference = None
-        mock_msg.guild.me.id = 999
-        mock_msg.content = f"<@999> Hello!"  # Bot mention
+    # Verify
+    assert result is mock_parent
 
-        # Execute
-        result = await find_parent_message(mock_msg)
 
-        # Verify
-        assert result is None  # Should not find a parent
+async def test_find_parent_thread_starter_fetch(mock_message_factory):
+    # Setup - Thread starter message, but need to fetch
+    mock_msg = mock_message_factory()
+    mock_parent = mock_message_factory()
 
-    @pytest.mark.asyncio
-    async def test_find_parent_error_handling(self):
-        # Setup - Discord API error
-        mock_msg = MagicMock(spec=discord.Message)
-        mock_msg.reference = MagicMock()
-        mock_msg.reference.message_id = 12345
-        mock_msg.reference.cached_message = None
+    mock_msg.reference = None
+    mock_msg.channel.type = discord.ChannelType.public_thread
+    mock_msg.channel.starter_message = None
+    mock_msg.channel.id = 12345
+    mock_msg.channel.parent.fetch_message = AsyncMock(return_value=mock_parent)
 
-        # Simulate a Discord API error
-        mock_msg.channel.fetch_message = AsyncMock(
-            side_effect=discord.NotFound(
-                response=MagicMock(), message="Message not found"
-            )
-        )
+    # Execute
+    result = await find_parent_message(mock_msg)
 
-        # Execute
-        result = await find_parent_message(mock_msg)
+    # Verify
+    assert result is mock_parent
+    mock_msg.channel.parent.fetch_message.assert_called_once_with(12345)
 
-        # Verify
-        assert result is None  # Should handle the error and return None
 
+async def test_find_parent_dm_previous_message(mock_message_factory):
+    # Setup - DM channel, previous message from bot
+    mock_msg = mock_message_factory()
+    mock_prev_msg = mock_message_factory()
 
-class TestCheckPermissions:
+    mock_msg.reference = None
+    mock_msg.channel.type = discord.ChannelType.private
+    mock_msg.author.bot = False
 
-    def test_check_dm_allowed(self, test_config, mock_discord_message):
-        # Setup
-        mock_discord_message.channel.type = discord.ChannelType.private
-        test_config.allow_dms = True
+    mock_prev_msg.author.bot = True
+    mock_prev_msg.type = discord.MessageType.default
 
-        # Execute
-        result = check_permissions(mock_discord_message, test_config)
+    # Mock channel history to return the previous message
+    mock_msg.channel.history = MagicMock(return_value=async_iter([mock_prev_msg]))
 
-        # Verify
-        assert result is True
+    # Execute
+    result = await find_parent_message(mock_msg)
 
-    def test_check_dm_not_allowed(self, test_config, mock_discord_message):
-        # Setup
-        mock_discord_message.channel.type = discord.ChannelType.private
-        test_config.allow_dms = False
+    # Verify
+    assert result is mock_prev_msg
 
-        # Execute
-        result = check_permissions(mock_discord_message, test_config)
 
-        # Verify
-        assert result is False
+async def test_find_parent_same_author_previous_message(mock_message_factory):
+    # Setup - Regular channel, previous message from same author
+    mock_msg = mock_message_factory()
+    mock_prev_msg = mock_message_factory()
 
-    def test_check_user_explicitly_allowed(self, test_config, mock_discord_message):
-        # Setup
-        user_id = 111  # From the mock_discord_message fixture
+    mock_msg.reference = None
+    mock_msg.channel.type = discord.ChannelType.text
+    mock_msg.guild.me = MagicMock()
+    mock_msg.content = "Hello"  # No bot mention
 
-        # Ensure user ID is in allowed list
-        test_config.permissions["users"]["allowed_ids"] = [user_id]
+    mock_prev_msg.author = mock_msg.author  # Same author
+    mock_prev_msg.type = discord.MessageType.default
 
-        # Execute
-        result = check_permissions(mock_discord_message, test_config)
+    # Mock channel history to return the previous message
+    mock_msg.channel.history = MagicMock(return_value=async_iter([mock_prev_msg]))
 
-        # Verify
-        assert result is True
+    # Execute
+    result = await find_parent_message(mock_msg)
 
-    def test_check_user_explicitly_blocked(self, test_config, mock_discord_message):
-        # Setup
-        user_id = 111  # From the mock_discord_message fixture
+    # Verify
+    assert result is mock_prev_msg
 
-        # Ensure user ID is in blocked list
-        test_config.permissions["users"]["blocked_ids"] = [user_id]
 
-        # Execute
-        result = check_permissions(mock_discord_message, test_config)
+async def test_find_parent_with_bot_mention(mock_message_factory):
+    # Setup - Message with bot mention should start a new conversation
+    mock_msg = mock_message_factory()
+    mock_msg.reference = None
+    mock_msg.guild.me.id = 999
+    mock_msg.content = f"<@999> Hello!"  # Bot mention
 
-        # Verify
-        assert result is False
+    # Execute
+    result = await find_parent_message(mock_msg)
 
-    def test_check_role_allowed(self, test_config, mock_discord_message):
-        # Setup
-        # Create roles with IDs
-        role1 = MagicMock(spec=discord.Role)
-        role1.id = 444  # This is in allowed_ids in the test_config fixture
+    # Verify
+    assert result is None  # Should not find a parent
 
-        role2 = MagicMock(spec=discord.Role)
-        role2.id = 999  # This is not in allowed_ids
 
-        # Assign roles to the author
-        mock_discord_message.author.roles = [role1, role2]
+async def test_find_parent_error_handling(mock_message_factory):
+    # Setup - Discord API error
+    mock_msg = mock_message_factory()
+    mock_msg.reference = MagicMock()
+    mock_msg.reference.message_id = 12345
+    mock_msg.reference.cached_message = None
 
-        # Execute
-        result = check_permissions(mock_discord_message, test_config)
+    # Simulate a Discord API error
+    mock_msg.channel.fetch_message = AsyncMock(
+        side_effect=discord.NotFound(response=MagicMock(), message="Message not found")
+    )
 
-        # Verify
-        assert result is True
+    # Execute
+    result = await find_parent_message(mock_msg)
 
-    def test_check_role_blocked(self, test_config, mock_discord_message):
-        # Setup
-        # Create roles with IDs
-        role1 = MagicMock(spec=discord.Role)
-        role1.id = 666  # This is in blocked_ids in the test_config fixture
+    # Verify
+    assert result is None  # Should handle the error and return None
 
-        role2 = MagicMock(spec=discord.Role)
-        role2.id = 999  # This is not in blocked_ids
 
-        # Assign roles to the author
-        mock_discord_message.author.roles = [role1, role2]
+def _permission_ids(scope, key, ids):
+    def mutate(config, msg):
+        config.permissions[scope][key] = ids
 
-        # Execute
-        result = check_permissions(mock_discord_message, test_config)
+    return mutate
 
-        # Verify
-        assert result is False
 
-    def test_check_channel_allowed(self, test_config, mock_discord_message):
-        # Setup
-        channel_id = 777  # From the mock_discord_message fixture
+def _roles(*role_ids):
+    def mutate(config, msg):
+        msg.author.roles = [SimpleNamespace(id=role_id) for role_id in role_ids]
 
-        # Ensure channel ID is in allowed list
-        test_config.permissions["channels"]["allowed_ids"] = [channel_id]
+    return mutate
 
-        # Execute
-        result = check_permissions(mock_discord_message, test_config)
 
-        # Verify
-        assert result is True
+def _channel_attr(name, value):
+    def mutate(config, msg):
+        setattr(msg.channel, name, value)
+        config.permissions["channels"]["allowed_ids"] = [value]
 
-    def test_check_channel_blocked(self, test_config, mock_discord_message):
-        # Setup
-        channel_id = 777  # From the mock_discord_message fixture
+    return mutate
 
-        # Ensure channel ID is in blocked list
-        test_config.permissions["channels"]["blocked_ids"] = [channel_id]
-
-        # Execute
-        result = check_permissions(mock_discord_message, test_config)
-
-        # Verify
-        assert result is False
-
-    def test_check_parent_channel_allowed(self, test_config, mock_discord_message):
-        # Setup - Thread channel with parent
-        mock_discord_message.channel.parent_id = 888  # This is in allowed_ids
-
-        # Ensure parent channel ID is in allowed list
-        test_config.permissions["channels"]["allowed_ids"] = [888]
-
-        # Execute
-        result = check_permissions(mock_discord_message, test_config)
-
-        # Verify
-        assert result is True
-
-    def test_check_category_channel_allowed(self, test_config, mock_discord_message):
-        # Setup - Channel with category
-        mock_discord_message.channel.category_id = 888  # This is in allowed_ids
-
-        # Ensure category ID is in allowed list
-        test_config.permissions["channels"]["allowed_ids"] = [888]
-
-        # Execute
-        result = check_permissions(mock_discord_message, test_config)
-
-        # Verify
-        assert result is True
-
-
-class TestCreateEmbedForWarnings:
-
-    def test_create_embed_empty_warnings(self):
-        # Setup
-        warnings = ConversationWarnings()
-
-        # Execute
-        embed = create_embed_for_warnings(warnings)
-
-        # Verify
-        assert isinstance(embed, discord.Embed)
-        assert len(embed.fields) == 0
-
-    def test_create_embed_with_warnings(self):
-        # Setup
-        warnings = ConversationWarnings()
-        warnings.add("Warning 1")
-        warnings.add("Warning 2")
-
-        # Execute
-        embed = create_embed_for_warnings(warnings)
-
-        # Verify
-        assert isinstance(embed, discord.Embed)
-        assert len(embed.fields) == 2
-        assert embed.fields[0].name == "Warning 1"
-        assert embed.fields[0].value == ""
-        assert embed.fields[1].name == "Warning 2"
-        assert embed.fields[1].value == ""
-
-
-class TestTruncateMessages:
-
-    def test_truncate_messages_empty(self):
-        # Setup
-        messages = []
-
-        # Execute
-        result = truncate_messages(messages, 1000)
-
-        # Verify
-        assert result == []
-
-    def test_truncate_messages_single_short(self):
-        # Setup
-        messages = [{"content": "Short message"}]
-
-        # Execute
-        result = truncate_messages(messages, 1000)
-
-        # Verify
-        assert len(result) == 1
-        assert result[0] == "Short message"
-
-    def test_truncate_messages_single_long(self):
-        # Setup
-        long_message = "a" * 1500
-        messages = [{"content": long_message}]
-
-        # Execute
-        result = truncate_messages(messages, 1000)
-
-        # Verify
-        assert len(result) == 2
-        assert result[0] == "a" * 1000
-        assert result[1] == "a" * 500
-
-    def test_truncate_messages_multiple(self):
-        # Setup
-        messages = [{"content": "First message"}, {"content": "Second message"}]
-
-        # Execute
-        result = truncate_messages(messages, 1000)
-
-        # Verify
-        assert len(result) == 1
-        assert result[0] == "First messageSecond message"
-
-    def test_truncate_messages_multiple_long(self):
-        # Setup
-        messages = [{"content": "a" * 900}, {"content": "b" * 300}]
-
-        # Execute
-        result = truncate_messages(messages, 1000)
-
-        # Verify
-        assert len(result) == 2
-        assert result[0] == "a" * 900
-        assert result[1] == "b" * 300
-
-    def test_truncate_messages_non_string_content(self):
-        # Setup
-        messages = [
-            {"content": 123},  # Non-string content
-            # {"role": "user"}  # Missing content
-        ]
-
-        # Execute
-        result = truncate_messages(messages, 1000)
-
-        # Verify - should handle gracefully
-        assert len(result) == 1
-        assert result[0] == ""  # Empty string for non-string content
+
+# The message comes from user 111 in channel 777; the test_config fixture
+# allows roles 444/555 and blocks role 666
+@pytest.mark.parametrize(
+    "mutate, expected",
+    [
+        pytest.param(
+            _permission_ids("users", "allowed_ids", [111]), True, id="user_allowed"
+        ),
+        pytest.param(
+            _permission_ids("users", "blocked_ids", [111]), False, id="user_blocked"
+        ),
+        pytest.param(_roles(444, 999), True, id="role_allowed"),
+        pytest.param(_roles(666, 999), False, id="role_blocked"),
+        pytest.param(
+            _permission_ids("channels", "allowed_ids", [777]),
+            True,
+            id="channel_allowed",
+        ),
+        pytest.param(
+            _permission_ids("channels", "blocked_ids", [777]),
+            False,
+            id="channel_blocked",
+        ),
+        pytest.param(
+            _channel_attr("parent_id", 888), True, id="parent_channel_allowed"
+        ),
+        pytest.param(
+            _channel_attr("category_id", 888), True, id="category_channel_allowed"
+        ),
+    ],
+)
+def test_check_permissions_matrix(test_config, mock_discord_message, mutate, expected):
+    # Setup
+    mutate(test_config, mock_discord_message)
+
+    # Execute
+    result = check_permissions(mock_discord_message, test_config)
+
+    # Verify
+    assert result is expected
+
+
+@pytest.mark.parametrize("allow_dms", [True, False])
+def test_check_dm(test_config, mock_dm_message, allow_dms):
+    # Setup
+    test_config.allow_dms = allow_dms
+
+    # Execute
+    result = check_permissions(mock_dm_message, test_config)
+
+    # Verify
+    assert result is allow_dms
+
+
+def test_create_embed_empty_warnings():
+    # Setup
+    warnings = ConversationWarnings()
+
+    # Execute
+    embed = create_embed_for_warnings(warnings)
+
+    # Verify
+    assert isinstance(embed, discord.Embed)
+    assert len(embed.fields) == 0
+
+
+def test_create_embed_with_warnings():
+    # Setup
+    warnings = ConversationWarnings()
+    warnings.add("Warning 1")
+    warnings.add("Warning 2")
+
+    # Execute
+    embed = create_embed_for_warnings(warnings)
+
+    # Verify
+    assert isinstance(embed, discord.Embed)
+    assert len(embed.fields) == 2
+    assert embed.fields[0].name == "Warning 1"
+    assert embed.fields[0].value == ""
+    assert embed.fields[1].name == "Warning 2"
+    assert embed.fields[1].value == ""
+
+
+@pytest.mark.parametrize(
+    "messages, expected",
+    [
+        pytest.param([], [], id="empty"),
+        pytest.param(
+            [{"content": "Short message"}], ["Short message"], id="single_short"
+        ),
+        pytest.param([{"content": _A1500}], [_A1000, _A500], id="single_long"),
+        pytest.param(
+            [{"content": "First message"}, {"content": "Second message"}],
+            ["First messageSecond message"],
+            id="multiple",
+        ),
+        pytest.param(
+            [{"content": _A900}, {"content": _B300}],
+            [_A900, _B300],
+            id="multiple_long",
+        ),
+        # Non-string content is handled gracefully as an empty string
+        pytest.param([{"content": 123}], [""], id="non_string_content"),
+    ],
+)
+def test_truncate_messages(messages, expected):
+    # Execute
+    result = truncate_messages(messages, 1000)
+
+    # Verify
+    assert result == expected
+
+
+async def test_buffer_stream_yields_in_order():
+    # Setup
+    async def stream():
+        for i in range(5):
+            yield i
+
+    # Execute
+    result = [item async for item in buffer_stream(stream(), maxsize=2)]
+
+    # Verify
+    assert result == [0, 1, 2, 3, 4]
+
+
+async def test_buffer_stream_reraises_after_items():
+    # Setup
+    async def stream():
+        yield "first"
+        raise ValueError("Stream error")
+
+    # Execute
+    result = []
+    with pytest.raises(ValueError, match="Stream error"):
+        async for item in buffer_stream(stream()):
+            result.append(item)
+
+    # Verify - items produced before the error are still delivered
+    assert result == ["first"]
+
+
+async def test_buffer_stream_early_exit_closes_source():
+    # Setup - an endless source that keeps the one-slot queue full
+    closed = False
+
+    async def stream():
+        nonlocal closed
+        try:
+            while True:
+                yield "chunk"
+        finally:
+            closed = True
+
+    tasks_before = asyncio.all_tasks()
+
+    # Execute
+    async with aclosing(buffer_stream(stream(), maxsize=1)) as buffered:
+        async for item in buffered:
+            await asyncio.sleep(0)  # Let the producer block on the full queue
+            break
+
+    # Verify - the producer has finished and the source was closed
+    assert asyncio.all_tasks() == tasks_before
+    assert closed is True